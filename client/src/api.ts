@@ -28,6 +28,10 @@ interface Chat {
   user_id: number;
   created_at: string;
   updated_at: string;
+  last_activity_at: string;
+  message_count: number;
+  last_message_preview?: string;
+  last_ai_message_id?: number;
 }
 
 interface Message {
@@ -88,6 +92,31 @@ async function authenticatedFetch(url: string, options: RequestInit = {}): Promi
   return response;
 }
 
+/**
+ * Fetch every page of a keyset-paginated list endpoint, following X-Before-Cursor
+ * until no older rows are left. Older pages go after the newest-first chat list
+ * and before the oldest-first message history.
+ */
+async function fetchAllPages<T>(url: string, newestFirst: boolean): Promise<T[]> {
+  const pageSize = 500;  // Server maximum: fewest round trips
+  let items: T[] = [];
+  let cursor: string | null = null;
+  
+  do {
+    const pageUrl: string = `${url}?limit=${pageSize}` + (cursor ? `&before=${encodeURIComponent(cursor)}` : '');
+    const response = await authenticatedFetch(pageUrl);
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+    
+    const page: T[] = await response.json();
+    items = newestFirst ? items.concat(page) : page.concat(items);
+    cursor = response.headers.get('X-Before-Cursor');
+  } while (cursor);
+  
+  return items;
+}
+
 // ===============================================================================
 // USER API FUNCTIONS
 // ===============================================================================
@@ -142,13 +171,7 @@ export async function loadChats(): Promise<Chat[]> {
       return [];
     }
     
-    const response = await authenticatedFetch(`${API_BASE}/chats`);
-    if (!response.ok) {
-      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-    }
-    
-    const data = await response.json();
-    return data;
+    return await fetchAllPages<Chat>(`${API_BASE}/chats`, true);
   } catch (error) {
     console.error('Fehler beim Laden der Chats:', error);
     return [];
@@ -217,13 +240,7 @@ export async function loadMessages(chatId: number): Promise<Message[]> {
       return [];
     }
     
-    const response = await authenticatedFetch(`${API_BASE}/messages/${chatId}`);
-    if (!response.ok) {
-      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-    }
-    
-    const data = await response.json();
-    return data;
+    return await fetchAllPages<Message>(`${API_BASE}/messages/${chatId}`, false);
   } catch (error) {
     console.error('Fehler beim Laden der Nachrichten:', error);
     return [];
@@ -231,15 +248,26 @@ export async function loadMessages(chatId: number): Promise<Message[]> {
 }
 
 export async function sendMessage(chatId: number, content: string, isFromUser: boolean = true): Promise<Message | null> {
+  // Same key on retry, so the server stores the message only once
+  const idempotencyKey = crypto.randomUUID();
+  const request = () => authenticatedFetch(`${API_BASE}/messages`, {
+    method: 'POST',
+    headers: { 'Idempotency-Key': idempotencyKey },
+    body: JSON.stringify({
+      chat_id: chatId,
+      content: content,
+      is_from_user: isFromUser
+    }),
+  });
+  
   try {
-    const response = await authenticatedFetch(`${API_BASE}/messages`, {
-      method: 'POST',
-      body: JSON.stringify({
-        chat_id: chatId,
-        content: content,
-        is_from_user: isFromUser
-      }),
-    });
+    let response: Response;
+    try {
+      response = await request();
+    } catch (networkError) {
+      // Connection dropped: the message may or may not have arrived, retry once
+      response = await request();
+    }
     
     if (!response.ok) {
       throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -274,8 +302,143 @@ export async function generateAIResponse(chatId: number): Promise<Message | null
   }
 }
 
+/**
+ * Send a user message and stream the AI answer in one request.
+ * onUserMessage receives the stored user message before the first token.
+ */
+export async function streamChatTurn(
+  chatId: number,
+  content: string,
+  onUserMessage: (message: Message) => void,
+  onToken: (token: string) => void
+): Promise<Message | null> {
+  // Same key on retry: the server stores the message once and replays an existing answer
+  const idempotencyKey = crypto.randomUUID();
+  const request = () => authenticatedFetch(`${API_BASE}/ai/turn/${chatId}/stream`, {
+    method: 'POST',
+    headers: { 'Accept': 'text/event-stream', 'Idempotency-Key': idempotencyKey },
+    body: JSON.stringify({ content: content }),
+  });
+  
+  try {
+    let response: Response;
+    try {
+      response = await request();
+    } catch (networkError) {
+      // Connection dropped before the response: the turn may or may not have arrived, retry once
+      response = await request();
+    }
+    
+    return await readAIStream(response, onToken, onUserMessage);
+  } catch (error) {
+    console.error('Fehler beim Streamen der AI-Antwort:', error);
+    return null;
+  }
+}
+
+// Parse the SSE protocol of the streaming AI endpoints (message/token/done/error)
+async function readAIStream(
+  response: Response,
+  onToken: (token: string) => void,
+  onUserMessage?: (message: Message) => void
+): Promise<Message | null> {
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+  }
+  
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    // Events are separated by a blank line
+    let boundary: number;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      
+      const payload = data ? JSON.parse(data) : {};
+      if (event === 'message') {
+        onUserMessage?.(payload as Message);
+      } else if (event === 'token') {
+        onToken(payload.content);
+      } else if (event === 'done') {
+        return payload as Message;
+      } else if (event === 'error') {
+        throw new Error(payload.detail);
+      }
+    }
+  }
+  
+  return null;
+}
+
+// ===============================================================================
+// LIVE UPDATES (WEBSOCKET)
+// ===============================================================================
+// Server push of changes made in other tabs/devices; reconnects with backoff
+
+type LiveEvent =
+  | { type: 'message.created'; message: Message }
+  | { type: 'ai.token'; chat_id: number; content: string; job_id?: number }
+  | { type: 'chat.created' | 'chat.updated'; chat: Chat }
+  | { type: 'chat.deleted'; chat_id: number }
+  | { type: 'job.updated'; job: { id: number; chat_id: number; status: string; result_message_id?: number } }
+  | { type: 'resync' };
+
+/**
+ * Open the live update channel. Events (and 'resync' after a reconnect, when
+ * some may have been missed) go to onEvent. Returns a function that closes it.
+ */
+export function connectLiveUpdates(onEvent: (event: LiveEvent) => void): () => void {
+  let socket: WebSocket | null = null;
+  let closed = false;
+  let retryDelay = 1000;
+  let connectedBefore = false;
+  
+  const connect = async () => {
+    const token = await authService.getAccessToken();
+    if (closed) return;
+    
+    socket = new WebSocket(`${API_BASE.replace(/^http/, 'ws')}/ws`);
+    socket.onopen = () => socket?.send(JSON.stringify({ type: 'auth', token: token ?? '' }));
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'ready') {
+        retryDelay = 1000;
+        if (connectedBefore) onEvent({ type: 'resync' });
+        connectedBefore = true;
+      } else if (event.type !== 'pong') {
+        onEvent(event as LiveEvent);
+      }
+    };
+    socket.onclose = () => {
+      if (closed) return;
+      setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    };
+  };
+  
+  connect();
+  return () => {
+    closed = true;
+    socket?.close();
+  };
+}
+
 // ===============================================================================
 // TYPE EXPORTS
 // ===============================================================================
 // Export types for use in other modules
-export type { Chat, Message, User };
+export type { Chat, Message, User, LiveEvent };
@@ -5,8 +5,8 @@
 // Handles message display, user input, AI conversation management, and welcome screen
 
 import './style.css';
-import type { Chat, Message } from './api.ts';
-import { loadMessages, sendMessage, generateAIResponse, createChat } from './api.ts';
+import type { Chat, Message, LiveEvent } from './api.ts';
+import { loadMessages, streamChatTurn, createChat } from './api.ts';
 
 // ===============================================================================
 // STATE MANAGEMENT
@@ -14,6 +14,9 @@ import { loadMessages, sendMessage, generateAIResponse, createChat } from './api
 // Current active chat state
 let activeChat: Chat | null = null;
 let isWelcomeMode: boolean = true; // Track if we're showing welcome screen
+let displayedMessageIds = new Set<number>(); // Live events may repeat what we already show
+let localTurnChatId: number | null = null; // This tab is streaming a turn in that chat
+let liveReplyDiv: HTMLDivElement | null = null; // AI answer streamed by another tab
 
 // ===============================================================================
 // DOM ELEMENTS CREATION
@@ -143,6 +146,8 @@ async function loadChatMessages(chatId: number) {
   try {
     const messages = await loadMessages(chatId);
     messagesContainer.innerHTML = ""; // Clear container
+    displayedMessageIds = new Set();
+    liveReplyDiv = null;
     
     messages.forEach(message => {
       displayMessage(message);
@@ -162,6 +167,9 @@ async function loadChatMessages(chatId: number) {
 
 // Display a single message in the UI
 function displayMessage(message: Message) {
+  if (displayedMessageIds.has(message.id)) return;
+  displayedMessageIds.add(message.id);
+  
   const messageDiv = document.createElement("div");
   messageDiv.className = `message ${message.is_from_user ? 'message-outgoing' : 'message-incoming'}`;
   
@@ -239,27 +247,11 @@ async function handleSendMessage() {
       return;
     }
 
-    // Send message to backend
-    const newMessage = await sendMessage(activeChat.id, messageContent, true);
+    // Update chat title in header
+    chatTitle.textContent = activeChat.title || `Chat ${activeChat.id}`;
     
-    if (newMessage) {
-      // Clear welcome screen and show messages
-      if (messagesContainer.contains(welcomeContainer)) {
-        messagesContainer.removeChild(welcomeContainer);
-      }
-      
-      // Display message in UI
-      displayMessage(newMessage);
-      messagesContainer.scrollTop = messagesContainer.scrollHeight;
-      
-      // Update chat title in header
-      chatTitle.textContent = activeChat.title || `Chat ${activeChat.id}`;
-      
-      // Generate AI response automatically
-      await generateAndDisplayAIResponse(activeChat.id);
-    } else {
-      alert('Fehler beim Senden der Nachricht');
-    }
+    // Store the message and stream the AI response in one request
+    await sendAndDisplayTurn(activeChat.id, messageContent);
   } catch (error) {
     console.error('Fehler beim Senden:', error);
     alert('Fehler beim Senden der Nachricht');
@@ -276,9 +268,9 @@ async function handleSendMessage() {
 // ===============================================================================
 // Generate and display AI responses with visual feedback
 
-// Generate AI response and show typing indicator
-async function generateAndDisplayAIResponse(chatId: number) {
-  // Show typing indicator while AI is thinking
+// Send the user message, then show typing indicator and the streamed AI response
+async function sendAndDisplayTurn(chatId: number, content: string) {
+  // Typing indicator while AI is thinking, shown once the message is stored
   const typingDiv = document.createElement("div");
   typingDiv.className = "message message-incoming typing-indicator";
   typingDiv.innerHTML = `
@@ -288,18 +280,45 @@ async function generateAndDisplayAIResponse(chatId: number) {
       </div>
     </div>
   `;
-  messagesContainer.appendChild(typingDiv);
-  messagesContainer.scrollTop = messagesContainer.scrollHeight;
   
+  let messageStored = false;
+  // Streamed tokens replace the typing dots as soon as the first one arrives
+  let streamedContent: HTMLDivElement | null = null;
+  
+  localTurnChatId = chatId;
   try {
-    const aiResponse = await generateAIResponse(chatId);
+    const aiResponse = await streamChatTurn(chatId, content, (newMessage) => {
+      messageStored = true;
+      
+      // Clear welcome screen and show messages
+      if (messagesContainer.contains(welcomeContainer)) {
+        messagesContainer.removeChild(welcomeContainer);
+      }
+      
+      // Display message in UI
+      displayMessage(newMessage);
+      messagesContainer.appendChild(typingDiv);
+      messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }, (token) => {
+      if (!streamedContent) {
+        typingDiv.className = "message message-incoming";
+        typingDiv.innerHTML = "";
+        streamedContent = document.createElement("div");
+        streamedContent.className = "message-content";
+        typingDiv.appendChild(streamedContent);
+      }
+      streamedContent.append(token);
+      messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    });
     
-    // Remove typing indicator safely
+    // Remove typing indicator / streaming placeholder safely
     if (typingDiv.parentNode) {
       messagesContainer.removeChild(typingDiv);
     }
     
-    if (aiResponse) {
+    if (!messageStored) {
+      alert('Fehler beim Senden der Nachricht');
+    } else if (aiResponse) {
       // Display AI response
       displayMessage(aiResponse);
       messagesContainer.scrollTop = messagesContainer.scrollHeight;
@@ -321,9 +340,56 @@ async function generateAndDisplayAIResponse(chatId: number) {
       messagesContainer.removeChild(typingDiv);
     }
     console.error('Fehler bei AI-Antwort:', error);
+  } finally {
+    localTurnChatId = null;
   }
 }
 
+// ===============================================================================
+// LIVE UPDATES
+// ===============================================================================
+// Messages, streamed AI answers and chat changes from other tabs/devices
+// (events are forwarded by the sidebar, which owns the connection)
+
+function handleLiveEvent(event: LiveEvent) {
+  if (event.type === 'chat.updated' && activeChat?.id === event.chat.id) {
+    activeChat = event.chat;
+    chatTitle.textContent = event.chat.title;
+  } else if (event.type === 'chat.deleted' && activeChat?.id === event.chat_id) {
+    activeChat = null;
+    showWelcomeMode();
+  } else if (event.type === 'resync' && activeChat) {
+    loadChatMessages(activeChat.id);
+  }
+  
+  // This tab's own turn is rendered by sendAndDisplayTurn
+  if (!activeChat || localTurnChatId === activeChat.id) return;
+  
+  if (event.type === 'ai.token' && event.chat_id === activeChat.id) {
+    if (!liveReplyDiv) {
+      liveReplyDiv = document.createElement("div");
+      liveReplyDiv.className = "message message-incoming";
+      const contentDiv = document.createElement("div");
+      contentDiv.className = "message-content";
+      liveReplyDiv.appendChild(contentDiv);
+      messagesContainer.appendChild(liveReplyDiv);
+    }
+    liveReplyDiv.firstElementChild!.append(event.content);
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+  } else if (event.type === 'message.created' && event.message.chat_id === activeChat.id) {
+    if (!event.message.is_from_user && liveReplyDiv) {
+      liveReplyDiv.remove();
+      liveReplyDiv = null;
+    }
+    displayMessage(event.message);
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+  }
+}
+
+window.addEventListener('liveEvent', (event: Event) => {
+  handleLiveEvent((event as CustomEvent).detail as LiveEvent);
+});
+
 // ===============================================================================
 // EXPORTS AND INITIALIZATION
 // ===============================================================================
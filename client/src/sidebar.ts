@@ -4,8 +4,8 @@
 // Chat list management with CRUD operations and authentication
 // Handles chat creation, deletion, renaming, and selection
 
-import { loadChats, createChat, deleteChat, updateChat } from './api.js';
-import type { Chat } from './api.js';
+import { loadChats, createChat, deleteChat, updateChat, connectLiveUpdates } from './api.js';
+import type { Chat, LiveEvent } from './api.js';
 import { setActiveChat } from './chat.js';
 
 // ===============================================================================
@@ -65,7 +65,7 @@ toggleButton.addEventListener("click", () => {
 newChatButton.addEventListener("click", async () => {
   const title = `Neuer Chat ${chats.length + 1}`;
   const newChat = await createChat(title);
-  if (newChat) {
+  if (newChat && !chats.some(c => c.id === newChat.id)) {
     chats.unshift(newChat);
     renderChats();
   }
@@ -102,6 +102,7 @@ function renderChats() {
     const a = document.createElement("a");
     a.href = "#";
     a.textContent = chat.title;
+    a.title = chat.last_message_preview ?? "";  // Newest message on hover
     a.className = "chat-item";
     a.addEventListener("click", () => {
       setActiveChat(chat);  // Switch to this chat
@@ -178,6 +179,36 @@ import { authService } from './auth.js';
 
 // Track if we already loaded chats to prevent endless loop
 let chatsLoaded = false;
+let disconnectLiveUpdates: (() => void) | null = null;
+
+// ===============================================================================
+// LIVE UPDATES
+// ===============================================================================
+// Apply changes pushed by the server (other tabs/devices) without refetching,
+// and pass every event on to the chat window
+
+function handleLiveEvent(event: LiveEvent) {
+  if (event.type === 'chat.created' || event.type === 'chat.updated') {
+    chats = [event.chat, ...chats.filter(c => c.id !== event.chat.id)];
+    chats.sort((a, b) => b.last_activity_at.localeCompare(a.last_activity_at));
+    renderChats();
+  } else if (event.type === 'chat.deleted') {
+    chats = chats.filter(c => c.id !== event.chat_id);
+    renderChats();
+  } else if (event.type === 'message.created') {
+    const chat = chats.find(c => c.id === event.message.chat_id);
+    if (chat) {
+      chat.message_count += 1;
+      chat.last_activity_at = event.message.created_at;
+      chat.last_message_preview = event.message.content.slice(0, 120);
+      chats = [chat, ...chats.filter(c => c !== chat)];
+      renderChats();
+    }
+  } else if (event.type === 'resync') {
+    loadAndRenderChats();
+  }
+  window.dispatchEvent(new CustomEvent('liveEvent', { detail: event }));
+}
 
 // Initialize sidebar after auth is ready
 authService.onAuthStateChanged(async (isAuthenticated) => {
@@ -185,11 +216,14 @@ authService.onAuthStateChanged(async (isAuthenticated) => {
     console.log('🔄 Auth state changed - loading chats (first time)');
     await loadAndRenderChats();
     chatsLoaded = true;
+    disconnectLiveUpdates = connectLiveUpdates(handleLiveEvent);
   } else if (!isAuthenticated) {
     // Clear chats when not authenticated and reset flag
     chats = [];
     renderChats();
     chatsLoaded = false;
+    disconnectLiveUpdates?.();
+    disconnectLiveUpdates = null;
   }
 });
 
@@ -200,7 +234,7 @@ authService.onAuthStateChanged(async (isAuthenticated) => {
 window.addEventListener('chatCreated', (event: Event) => {
   const customEvent = event as CustomEvent;
   const newChat = customEvent.detail;
-  chats.unshift(newChat);  // Add to beginning of list
+  chats = [newChat, ...chats.filter(c => c.id !== newChat.id)];  // Add to beginning of list
   renderChats();
   
   // Auto-select the new chat
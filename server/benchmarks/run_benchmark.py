@@ -0,0 +1,343 @@
+# ===============================================================================
+# CRUD AI CHAT APP - API BENCHMARK HARNESS
+# ===============================================================================
+# Starts main:app (uvicorn) against a fresh database plus a stub Ollama server,
+# then measures latency percentiles and throughput of the hot endpoints at
+# increasing concurrency and chat history sizes. Results are written as JSON
+# so runs can be compared to catch regressions.
+#
+# Run from server/benchmarks:
+#   python run_benchmark.py                                  # SQLite in a temp dir
+#   python run_benchmark.py --database-url postgresql://user:pw@localhost/bench
+#   python run_benchmark.py --output new.json --compare baseline.json
+#
+# Auth0 is disabled for the spawned server (development mock user).
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SRC = os.path.join(HERE, "..", "src")
+
+# ===============================================================================
+# PROCESS MANAGEMENT
+# ===============================================================================
+# The API and the stub run as real uvicorn processes, so the numbers include
+# HTTP parsing, serialization and the DB driver - like production.
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_uvicorn(app: str, cwd: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL
+    )
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+# ===============================================================================
+# DATA SEEDING
+# ===============================================================================
+# Chats are created through the API (so the mock user exists), their history
+# is bulk-inserted directly - posting thousands of messages would dominate
+# the run time.
+
+async def seed_history(database_url: str, chat_ids: List[int], history: int):
+    if history <= 0:
+        return
+    sys.path.insert(0, SERVER_SRC)
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from database import to_async_url
+    from models import Message
+
+    engine = create_async_engine(to_async_url(database_url))
+    start = datetime.utcnow() - timedelta(seconds=history)
+    rows = [
+        {
+            "chat_id": chat_id,
+            "content": f"Seed message {i} " + "lorem ipsum " * 10,
+            "is_from_user": i % 2 == 0,
+            "created_at": start + timedelta(seconds=i),
+        }
+        for chat_id in chat_ids
+        for i in range(history)
+    ]
+    async with engine.begin() as conn:
+        for offset in range(0, len(rows), 5000):
+            await conn.execute(insert(Message), rows[offset:offset + 5000])
+    await engine.dispose()
+
+async def create_chats(client: httpx.AsyncClient, count: int, prefix: str) -> List[int]:
+    chat_ids = []
+    for i in range(count):
+        response = await client.post("/chats", json={"title": f"{prefix} {i}"})
+        response.raise_for_status()
+        chat_ids.append(response.json()["id"])
+    return chat_ids
+
+# ===============================================================================
+# LOAD GENERATION
+# ===============================================================================
+# `concurrency` workers issue requests back to back until `total` requests
+# were sent. Each worker gets its own index (e.g. its own chat); `prepare`
+# runs before each request without being timed.
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def run_load(
+    concurrency: int,
+    total: int,
+    request: Callable[[int, int], Awaitable[httpx.Response]],
+    prepare: Optional[Callable[[int, int], Awaitable[Any]]] = None
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker(worker_index: int):
+        for n in counter:
+            if prepare is not None:
+                await prepare(worker_index, n)  # Untimed setup
+            started = time.perf_counter()
+            try:
+                response = await request(worker_index, n)
+                error = str(response.status_code) if response.status_code >= 400 else None
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+# ===============================================================================
+# SCENARIOS
+# ===============================================================================
+
+async def run_scenarios(args, api_url: str, database_url: str) -> List[Dict]:
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency) * 2)
+    # Any bearer token passes while Auth0 is disabled
+    headers = {"Authorization": "Bearer benchmark"}
+    async with httpx.AsyncClient(base_url=api_url, headers=headers, limits=limits, timeout=120.0) as client:
+        for history in args.history:
+            # One chat per worker so AI generations don't coalesce or share locks
+            chat_ids = await create_chats(client, max(args.concurrency), f"bench h={history}")
+            await seed_history(database_url, chat_ids, history)
+
+            for concurrency in args.concurrency:
+                # AI turns need a new user message first (posted untimed)
+                post_user_message = lambda w, n: client.post(
+                    "/messages", json={"chat_id": chat_ids[w], "content": f"bench question {n}", "is_from_user": True}
+                )
+                scenarios = [
+                    ("GET /chats", args.requests, None,
+                     lambda w, n: client.get("/chats")),
+                    ("GET /messages/{chat_id}", args.requests, None,
+                     lambda w, n: client.get(f"/messages/{chat_ids[w]}")),
+                    ("POST /messages", args.requests, None,
+                     lambda w, n: client.post("/messages", json={"chat_id": chat_ids[w], "content": f"bench {n}", "is_from_user": True})),
+                    ("POST /ai/generate/{chat_id}", args.ai_requests, post_user_message,
+                     lambda w, n: client.post(f"/ai/generate/{chat_ids[w]}")),
+                ]
+                for name, total, prepare, request in scenarios:
+                    if total <= 0:
+                        continue
+                    stats = await run_load(concurrency, total, request, prepare)
+                    result = {"endpoint": name, "history": history, "concurrency": concurrency, **stats}
+                    results.append(result)
+                    print(f"{name:30} history={history:<6} concurrency={concurrency:<4} "
+                          f"p50={stats['p50_ms']:>8.2f}ms p99={stats['p99_ms']:>8.2f}ms "
+                          f"{stats['throughput_rps']:>8.1f} req/s errors={stats['errors']} {stats['error_types'] or ''}")
+    return results
+
+# ===============================================================================
+# REGRESSION CHECK
+# ===============================================================================
+# Compare p99 latency and throughput against a previous JSON result.
+
+def compare(results: List[Dict], baseline_path: str, threshold_pct: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {(r["endpoint"], r["history"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result["endpoint"], result["history"], result["concurrency"]))
+        if before is None:
+            continue
+        label = f"{result['endpoint']} history={result['history']} concurrency={result['concurrency']}"
+        if before["p99_ms"] and result["p99_ms"] > before["p99_ms"] * (1 + threshold_pct / 100):
+            regressions.append(f"{label}: p99 {before['p99_ms']}ms -> {result['p99_ms']}ms")
+        if before["throughput_rps"] and result["throughput_rps"] < before["throughput_rps"] * (1 - threshold_pct / 100):
+            regressions.append(f"{label}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+# ===============================================================================
+# ENTRY POINT
+# ===============================================================================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the CRUD AI Chat API hot paths")
+    parser.add_argument("--database-url", help="Database to benchmark against (default: fresh SQLite file in a temp dir)")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32], help="Comma-separated concurrency levels")
+    parser.add_argument("--history", type=int_list, default=[10, 100, 1000], help="Comma-separated messages per chat")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per CRUD scenario")
+    parser.add_argument("--ai-requests", type=int, default=50, help="Requests per AI scenario (0 skips)")
+    parser.add_argument("--prompt-latency-ms", type=float, default=50, help="Stub Ollama delay before the first token")
+    parser.add_argument("--token-latency-ms", type=float, default=10, help="Stub Ollama delay between tokens")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per stub answer")
+    parser.add_argument("--ai-concurrency", type=int, default=8, help="OLLAMA_MAX_CONCURRENCY for the server")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Previous JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed regression in percent (with --compare)")
+    return parser.parse_args()
+
+async def main() -> int:
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="crudai-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    stub_port, api_port = free_port(), free_port()
+
+    stub_env = {
+        **os.environ,
+        "STUB_PROMPT_LATENCY_MS": str(args.prompt_latency_ms),
+        "STUB_TOKEN_LATENCY_MS": str(args.token_latency_ms),
+        "STUB_TOKENS": str(args.tokens),
+    }
+    api_env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "OLLAMA_MAX_CONCURRENCY": str(args.ai_concurrency),
+        # One mock user sends everything: don't let per-user fairness reject the load
+        "OLLAMA_MAX_QUEUE": "10000",
+        "OLLAMA_MAX_QUEUE_PER_USER": "10000",
+        "OLLAMA_QUEUE_TIMEOUT": "300",
+        "AI_RESPONSE_CACHE": "off",
+        # Empty values win over .env files: runs without authentication
+        "AUTH0_DOMAIN": "",
+        "AUTH0_API_AUDIENCE": "",
+        "AUTH0_ISSUER": "",
+    }
+    api_env.pop("LLM_BACKENDS", None)
+
+    stub = start_uvicorn("stub_ollama:app", HERE, stub_port, stub_env)
+    api = None
+    try:
+        await wait_until_ready(f"http://127.0.0.1:{stub_port}/api/tags", stub)
+        # Run from the temp dir so relative paths (SQLite, caches) stay out of the repo
+        api_env["PYTHONPATH"] = os.path.abspath(SERVER_SRC)
+        api = start_uvicorn("main:app", workdir, api_port, api_env)
+        api_url = f"http://127.0.0.1:{api_port}"
+        await wait_until_ready(api_url + "/", api)
+
+        # The health monitor must have seen the stub before AI requests are admitted
+        async with httpx.AsyncClient(base_url=api_url) as client:
+            for _ in range(50):
+                if (await client.get("/")).json().get("ai_status", {}).get("available"):
+                    break
+                await asyncio.sleep(0.2)
+
+        results = await run_scenarios(args, api_url, database_url)
+    finally:
+        if api is not None:
+            stop(api)
+        stop(stub)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database_url.split(":", 1)[0],
+            "stub": {
+                "prompt_latency_ms": args.prompt_latency_ms,
+                "token_latency_ms": args.token_latency_ms,
+                "tokens": args.tokens,
+            },
+            "ai_concurrency": args.ai_concurrency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            return 1
+        print(f"✅ No regressions beyond {args.threshold}% compared to {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,47 @@
+# ===============================================================================
+# CRUD AI CHAT APP - STUB OLLAMA SERVER (BENCHMARKS)
+# ===============================================================================
+# Minimal stand-in for Ollama's /api/tags and /api/chat with configurable latency
+# Lets the benchmark measure the API itself instead of a real model
+#
+# Run with: uvicorn stub_ollama:app --port 11500
+#   STUB_MODEL=llama3.2:3b         model name reported by /api/tags
+#   STUB_PROMPT_LATENCY_MS=50      delay before the first token
+#   STUB_TOKEN_LATENCY_MS=10       delay between tokens
+#   STUB_TOKENS=20                 tokens per answer
+
+import asyncio
+import json
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+MODEL = os.getenv("STUB_MODEL", "llama3.2:3b")
+PROMPT_LATENCY = float(os.getenv("STUB_PROMPT_LATENCY_MS", "50")) / 1000
+TOKEN_LATENCY = float(os.getenv("STUB_TOKEN_LATENCY_MS", "10")) / 1000
+TOKENS = int(os.getenv("STUB_TOKENS", "20"))
+
+app = FastAPI(title="Stub Ollama")
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": MODEL}]}
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    payload = await request.json()
+    stats = {"prompt_eval_count": len(payload.get("messages", [])), "eval_count": TOKENS}
+
+    if not payload.get("stream", True):
+        await asyncio.sleep(PROMPT_LATENCY + TOKEN_LATENCY * TOKENS)
+        content = " ".join(f"token{i}" for i in range(TOKENS))
+        return {"model": MODEL, "message": {"role": "assistant", "content": content}, "done": True, **stats}
+
+    async def ndjson():
+        await asyncio.sleep(PROMPT_LATENCY)
+        for i in range(TOKENS):
+            yield json.dumps({"model": MODEL, "message": {"role": "assistant", "content": f"token{i} "}, "done": False}) + "\n"
+            await asyncio.sleep(TOKEN_LATENCY)
+        yield json.dumps({"model": MODEL, "message": {"role": "assistant", "content": ""}, "done": True, **stats}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -6,99 +6,635 @@
 
 import httpx
 import json
+import logging
 import os
-from typing import Optional, Dict, Any
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, Deque, Hashable, List
+from response_cache import make_cache_key
+from metrics import AI_QUEUE_WAIT_SECONDS, LLM_ERRORS, LLM_REQUEST_SECONDS, LLM_TTFT_SECONDS, record_llm_usage
+
+logger = logging.getLogger(__name__)
 
 # ===============================================================================
-# OLLAMA SERVICE CLASS
+# HEALTH STATE / CIRCUIT BREAKER
 # ===============================================================================
-# Main service class for interacting with Ollama AI models
+# Cached view of Ollama's availability, fed by the background health monitor
+# and by the outcome of real generation calls.
 
-class OllamaService:
-    def __init__(self, base_url: str = None, model: str = "llama3.2:3b"):
-        # Use environment variable or default to localhost
-        self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        self.model = model
-        self.client = httpx.AsyncClient()
-        print(f"🤖 Ollama Service initialized with URL: {self.base_url}, Model: {self.model}")
+class OllamaHealth:
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 15.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.reachable: Optional[bool] = None  # None = not checked yet
+        self.model_present: Optional[bool] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_checked = 0.0
+        self.last_error: Optional[str] = None
     
-    # ===============================================================================
-    # AI RESPONSE GENERATION
-    # ===============================================================================
-    # Generate AI response using Ollama's chat completion API
-    async def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
-        """
-        Generate AI response using Ollama
-        """
+    def is_available(self) -> bool:
+        """True unless Ollama or the model is known to be down (no I/O)"""
+        if self.reachable is False or self.model_present is False:
+            return False
+        # Open circuit: fail fast until the cooldown elapses, then let calls probe again
+        return time.monotonic() >= self.open_until
+    
+    def record_success(self):
+        self.reachable = True
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error = None
+    
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.consecutive_failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+    
+    def record_probe(self, reachable: bool, model_present: Optional[bool], error: Optional[str] = None):
+        self.last_checked = time.monotonic()
+        self.reachable = reachable
+        self.model_present = model_present
+        if reachable and model_present:
+            self.record_success()
+        elif error:
+            self.last_error = error
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "available": self.is_available(),
+            "reachable": self.reachable,
+            "model_present": self.model_present,
+            "circuit_open": time.monotonic() < self.open_until,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+# ===============================================================================
+# GENERATION ADMISSION CONTROL
+# ===============================================================================
+# Bounds concurrent generations sent to Ollama. Excess requests wait in a
+# per-user queue served round-robin, so one user's burst can't starve others.
+
+class GenerationRejected(Exception):
+    """Raised when a generation can't be admitted (maps to 429/503 + Retry-After)"""
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class GenerationLimiter:
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 32, max_queue_per_user: int = 4, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.avg_service_time = 10.0  # EWMA seconds, seeds the Retry-After estimate
+    
+    def retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a new request"""
+        backlog = (self.queued + 1) / max(self.max_in_flight, 1)
+        return max(1, math.ceil(self.avg_service_time * backlog))
+    
+    def _record_wait(self, waited: float):
+        AI_QUEUE_WAIT_SECONDS.observe(waited)
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+    
+    def _remove_waiter(self, user_id: Hashable, future: asyncio.Future):
+        user_queue = self._waiters.get(user_id)
+        if user_queue and future in user_queue:
+            user_queue.remove(future)
+            self.queued -= 1
+            if not user_queue:
+                del self._waiters[user_id]
+    
+    def _give_up(self, user_id: Hashable, future: asyncio.Future):
+        """Leave the queue; a slot granted at the same moment is passed on"""
+        if future.done() and not future.cancelled():
+            self.in_flight -= 1
+            self._grant_next()
+        else:
+            future.cancel()
+            self._remove_waiter(user_id, future)
+    
+    def _grant_next(self):
+        while self.in_flight < self.max_in_flight and self._waiters:
+            user_id, user_queue = next(iter(self._waiters.items()))
+            future = user_queue.popleft()
+            self.queued -= 1
+            # Round-robin: this user goes to the back of the line
+            if user_queue:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+            # Timed out or cancelled, but its acquire() hasn't run its cleanup yet
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+    
+    async def acquire(self, user_id: Hashable) -> float:
+        """Wait for a generation slot; returns a ticket to pass to release()"""
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            return time.monotonic()
+        
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise GenerationRejected(503, "AI service busy, please retry later", self.retry_after())
+        user_queue = self._waiters.get(user_id)
+        if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+            self.rejected += 1
+            raise GenerationRejected(429, "Too many pending AI requests", self.retry_after())
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        enqueued_at = time.monotonic()
+        # asyncio.wait (not wait_for): never swallows our cancellation, never cancels the future
         try:
-            messages = []
-            
-            # Add system prompt if provided (sets AI behavior/personality)
-            if system_prompt:
-                messages.append({
-                    "role": "system", 
-                    "content": system_prompt
-                })
-            
-            # Add user message
-            messages.append({
-                "role": "user",
-                "content": prompt
+            await asyncio.wait((future,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._give_up(user_id, future)
+            raise
+        if not future.done() or future.cancelled():
+            self._give_up(user_id, future)
+            self.timed_out += 1
+            raise GenerationRejected(503, "Timed out waiting for AI capacity", self.retry_after())
+        
+        now = time.monotonic()
+        self._record_wait(now - enqueued_at)
+        return now
+    
+    def release(self, ticket: float):
+        """Free the slot taken by acquire() and admit the next waiter"""
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * (time.monotonic() - ticket)
+        self.in_flight -= 1
+        self._grant_next()
+    
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable):
+        ticket = await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_queue_wait_ms": round(self.wait_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_queue_wait_ms": round(self.wait_max * 1000, 1),
+        }
+
+# ===============================================================================
+# LLM BACKENDS
+# ===============================================================================
+# One model host each: a native Ollama server or an OpenAI-compatible endpoint
+# (vLLM, llama.cpp server, LocalAI, OpenAI, ...). Each keeps its own health
+# state and count of outstanding requests. Streams are normalized to Ollama's
+# chunk format: {"message": {"content": ...}, "done": bool}.
+
+class LLMBackend:
+    kind = "base"
+    
+    def __init__(self, base_url: str, model: str, health: OllamaHealth):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.health = health
+        self.outstanding = 0  # Requests currently running on this backend
+    
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.base_url}"
+    
+    @staticmethod
+    def _chat_messages(messages: List[Dict[str, str]], system_prompt: Optional[str]) -> List[Dict[str, str]]:
+        chat_messages = []
+        
+        # Add system prompt if provided (sets AI behavior/personality)
+        if system_prompt:
+            chat_messages.append({
+                "role": "system", 
+                "content": system_prompt
             })
-            
-            # Prepare API payload
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "stream": False
-            }
-            
+        
+        # Conversation turns, oldest first: {"role": "user" | "assistant", "content": ...}
+        chat_messages.extend(messages)
+        return chat_messages
+    
+    def _record_api_error(self, status_code: int, body: str):
+        """Feed a non-200 response into the health state"""
+        if status_code == 404:
+            # Ollama answers 404 when the model isn't pulled
+            self.health.record_probe(reachable=True, model_present=False, error=body)
+        elif status_code >= 500:
+            self.health.record_failure(f"{status_code}: {body}")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {"name": self.name, "model": self.model, "outstanding": self.outstanding, **self.health.snapshot()}
+
+class OllamaBackend(LLMBackend):
+    kind = "ollama"
+    
+    def __init__(self, base_url: str, model: str, health: OllamaHealth, keep_alive: Optional[str] = None):
+        super().__init__(base_url, model, health)
+        self.keep_alive = keep_alive
+    
+    # Native multi-turn chat payload shared by blocking and streaming generation.
+    # The system prompt goes first and should stay identical across turns, so
+    # Ollama can reuse its KV cache for the unchanged conversation prefix.
+    def build_payload(self, messages: List[Dict[str, str]], system_prompt: Optional[str], stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": self._chat_messages(messages, system_prompt),
+            "stream": stream
+        }
+        # Keep the model (and its prompt cache) loaded between turns
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+    
+    async def generate(self, client: httpx.AsyncClient, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> Optional[str]:
+        try:
             # Call Ollama API
-            response = await self.client.post(
+            response = await client.post(
                 f"{self.base_url}/api/chat",
-                json=payload,
+                json=self.build_payload(messages, system_prompt, stream=False),
                 timeout=30.0
             )
             
             # Process response
             if response.status_code == 200:
+                self.health.record_success()
                 result = response.json()
+                record_llm_usage(self.name, result)
                 return result.get("message", {}).get("content", "")
             else:
-                print(f"Ollama API Error: {response.status_code} - {response.text}")
+                logger.warning("Ollama API error (%s): %s - %s", self.base_url, response.status_code, response.text)
+                self._record_api_error(response.status_code, response.text)
                 return None
                 
         except Exception as e:
-            print(f"Error calling Ollama API: {e}")
+            logger.warning("Error calling Ollama API (%s): %s", self.base_url, e)
+            self.health.record_failure(str(e))
+            return None
+    
+    async def stream(self, client: httpx.AsyncClient, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        payload = self.build_payload(messages, system_prompt, stream=True)
+        
+        # The read timeout applies between chunks, so long answers don't time out
+        try:
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/api/chat",
+                json=payload,
+                timeout=httpx.Timeout(30.0)
+            ) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode(errors="replace")
+                    self._record_api_error(response.status_code, body)
+                    raise RuntimeError(f"Ollama API Error: {response.status_code} - {body}")
+                
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama API Error: {chunk['error']}")
+                    if chunk.get("done"):
+                        self.health.record_success()
+                        record_llm_usage(self.name, chunk)
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            self.health.record_failure(str(e))
+            raise
+    
+    async def probe(self, client: httpx.AsyncClient):
+        """Probe Ollama's model list and update the health state"""
+        try:
+            response = await client.get(f"{self.base_url}/api/tags", timeout=5.0)
+            if response.status_code == 200:
+                models = response.json().get("models", [])
+                model_present = any(model.get("name", "").startswith(self.model.split(":")[0]) for model in models)
+                self.health.record_probe(reachable=True, model_present=model_present,
+                                         error=None if model_present else f"Model {self.model} not found")
+            else:
+                self.health.record_probe(reachable=False, model_present=None, error=f"HTTP {response.status_code}")
+        except Exception as e:
+            self.health.record_probe(reachable=False, model_present=None, error=str(e))
+
+class OpenAICompatibleBackend(LLMBackend):
+    kind = "openai"
+    
+    def __init__(self, base_url: str, model: str, health: OllamaHealth, api_key: Optional[str] = None):
+        super().__init__(base_url, model, health)
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    
+    def build_payload(self, messages: List[Dict[str, str]], system_prompt: Optional[str], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": self._chat_messages(messages, system_prompt),
+            "stream": stream
+        }
+    
+    async def generate(self, client: httpx.AsyncClient, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> Optional[str]:
+        try:
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                json=self.build_payload(messages, system_prompt, stream=False),
+                headers=self.headers,
+                timeout=30.0
+            )
+            if response.status_code == 200:
+                self.health.record_success()
+                result = response.json()
+                record_llm_usage(self.name, result)
+                choices = result.get("choices") or [{}]
+                return choices[0].get("message", {}).get("content", "")
+            else:
+                logger.warning("OpenAI-compatible API error (%s): %s - %s", self.base_url, response.status_code, response.text)
+                self._record_api_error(response.status_code, response.text)
+                return None
+        except Exception as e:
+            logger.warning("Error calling OpenAI-compatible API (%s): %s", self.base_url, e)
+            self.health.record_failure(str(e))
             return None
     
+    async def stream(self, client: httpx.AsyncClient, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        payload = self.build_payload(messages, system_prompt, stream=True)
+        try:
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self.headers,
+                timeout=httpx.Timeout(30.0)
+            ) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode(errors="replace")
+                    self._record_api_error(response.status_code, body)
+                    raise RuntimeError(f"OpenAI-compatible API Error: {response.status_code} - {body}")
+                
+                # Server-Sent Events: "data: {...}" lines, terminated by "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if "error" in event:
+                        raise RuntimeError(f"OpenAI-compatible API Error: {event['error']}")
+                    if event.get("usage"):
+                        record_llm_usage(self.name, event)
+                    for choice in event.get("choices", []):
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            yield {"message": {"role": "assistant", "content": content}, "done": False}
+                self.health.record_success()
+                yield {"message": {"role": "assistant", "content": ""}, "done": True}
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            self.health.record_failure(str(e))
+            raise
+    
+    async def probe(self, client: httpx.AsyncClient):
+        """Probe the endpoint's model list and update the health state"""
+        try:
+            response = await client.get(f"{self.base_url}/models", headers=self.headers, timeout=5.0)
+            if response.status_code == 200:
+                models = response.json().get("data", [])
+                model_present = any(model.get("id") == self.model for model in models)
+                self.health.record_probe(reachable=True, model_present=model_present,
+                                         error=None if model_present else f"Model {self.model} not found")
+            else:
+                self.health.record_probe(reachable=False, model_present=None, error=f"HTTP {response.status_code}")
+        except Exception as e:
+            self.health.record_probe(reachable=False, model_present=None, error=str(e))
+
+BACKEND_TYPES = {"ollama": OllamaBackend, "openai": OpenAICompatibleBackend}
+
+def parse_backends(spec: str, default_model: str) -> List[Dict[str, str]]:
+    """Parse LLM_BACKENDS: comma-separated "kind url [model]" entries"""
+    backends = []
+    for entry in spec.split(","):
+        parts = entry.split()
+        if not parts:
+            continue
+        if len(parts) == 1:
+            parts = ["ollama"] + parts
+        kind, url = parts[0].lower(), parts[1]
+        if kind not in BACKEND_TYPES:
+            raise ValueError(f"Unknown LLM backend type '{kind}' (expected one of {', '.join(BACKEND_TYPES)})")
+        backends.append({"kind": kind, "url": url, "model": parts[2] if len(parts) > 2 else default_model})
+    return backends
+
+# ===============================================================================
+# OLLAMA SERVICE CLASS
+# ===============================================================================
+# Routes generations across the configured backends: the available backend
+# with the fewest outstanding requests wins, and a failed request fails over
+# to the next one (streams only until the first token was sent).
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Shared client with explicit pool limits; HTTP/2 if enabled and installed"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    )
+    http2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes", "on")
+    if http2:
+        try:
+            import h2  # noqa: F401 - optional dependency of httpx[http2]
+        except ImportError:
+            logger.warning("LLM_HTTP2 is set but the h2 package is not installed - using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=httpx.Timeout(30.0, connect=5.0))
+
+class OllamaService:
+    def __init__(self, base_url: str = None, model: str = None):
+        self.model = model or os.getenv("OLLAMA_MODEL", "llama3.2:3b")
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.client = _create_http_client()
+        self.health_interval = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "30"))
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._rotation = 0  # Breaks ties between equally loaded backends
+        
+        # LLM_BACKENDS lists several hosts; otherwise use the single OLLAMA_BASE_URL
+        spec = os.getenv("LLM_BACKENDS")
+        if base_url or not spec:
+            spec = f"ollama {base_url or os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')}"
+        self.backends: List[LLMBackend] = [self._create_backend(**entry) for entry in parse_backends(spec, self.model)]
+        self.base_url = self.backends[0].base_url
+        for backend in self.backends:
+            logger.info("AI backend initialized: %s, model: %s", backend.name, backend.model)
+        # Any configured backend may answer, so cached answers are keyed on all their models
+        models = sorted({backend.model for backend in self.backends})
+        self.cache_model = models[0] if len(models) == 1 else models
+    
+    def _create_backend(self, kind: str, url: str, model: str) -> LLMBackend:
+        health = OllamaHealth(
+            failure_threshold=int(os.getenv("OLLAMA_CIRCUIT_FAILURE_THRESHOLD", "3")),
+            cooldown=float(os.getenv("OLLAMA_CIRCUIT_COOLDOWN", "15"))
+        )
+        if kind == "openai":
+            return OpenAICompatibleBackend(url, model, health, api_key=os.getenv("LLM_OPENAI_API_KEY"))
+        return OllamaBackend(url, model, health, keep_alive=self.keep_alive)
+    
+    def _candidates(self) -> List[LLMBackend]:
+        """Available backends, least outstanding requests first (ties rotate)"""
+        self._rotation = (self._rotation + 1) % len(self.backends)
+        rotated = self.backends[self._rotation:] + self.backends[:self._rotation]
+        return sorted((b for b in rotated if b.health.is_available()), key=lambda b: b.outstanding)
+    
+    def cache_key(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> str:
+        """Response-cache key for this conversation with the configured backends' models/options"""
+        return make_cache_key({
+            "model": self.cache_model,
+            "messages": LLMBackend._chat_messages(messages, system_prompt),
+        })
+    
+    # ===============================================================================
+    # AI RESPONSE GENERATION
+    # ===============================================================================
+    # Generate AI response on the least loaded backend, failing over on errors
+    async def generate_response(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> Optional[str]:
+        """
+        Generate AI response for a role-tagged conversation
+        """
+        for backend in self._candidates():
+            backend.outstanding += 1
+            started = time.perf_counter()
+            try:
+                result = await backend.generate(self.client, messages, system_prompt)
+            finally:
+                backend.outstanding -= 1
+            if result is not None:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, backend=backend.name, mode="generate")
+                return result
+            LLM_ERRORS.inc(backend=backend.name)
+            logger.warning("Generation failed on %s, trying next backend", backend.name)
+        return None
+    
+    # ===============================================================================
+    # STREAMING AI RESPONSE GENERATION
+    # ===============================================================================
+    # Relay the backend's token stream chunk by chunk
+    async def stream_response(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream AI response chunks for a role-tagged conversation.
+        Yields Ollama-style chunks; the final one has "done": True.
+        Fails over to another backend only before the first chunk was
+        yielded. Raises on connection or API errors.
+        """
+        last_error: Optional[Exception] = None
+        for backend in self._candidates():
+            started = False
+            backend.outstanding += 1
+            request_started = time.perf_counter()
+            try:
+                async for chunk in backend.stream(self.client, messages, system_prompt):
+                    if not started:
+                        started = True
+                        LLM_TTFT_SECONDS.observe(time.perf_counter() - request_started, backend=backend.name)
+                    yield chunk
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - request_started, backend=backend.name, mode="stream")
+                return
+            except Exception as e:
+                LLM_ERRORS.inc(backend=backend.name)
+                if started:
+                    raise
+                last_error = e
+                logger.warning("Stream failed on %s (%s), trying next backend", backend.name, e)
+            finally:
+                backend.outstanding -= 1
+        raise last_error or RuntimeError("No AI backend available")
+    
     # ===============================================================================
     # SERVICE AVAILABILITY CHECK
     # ===============================================================================
-    # Check if Ollama service is running and the model is available
-    async def is_available(self) -> bool:
+    # Cached availability for the hot path; the background monitor and real calls keep it current
+    def is_available(self) -> bool:
         """
-        Check if Ollama service is running and model is available
+        Check if any backend is believed to be up with the model available (no HTTP call)
         """
-        try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return any(model.get("name", "").startswith(self.model.split(":")[0]) for model in models)
-            return False
-        except Exception:
-            return False
+        return any(backend.health.is_available() for backend in self.backends)
+    
+    async def check_health(self) -> bool:
+        """
+        Probe all backends and update their cached health state
+        """
+        await asyncio.gather(*(backend.probe(self.client) for backend in self.backends))
+        return self.is_available()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "available": self.is_available(),
+            "backends": [backend.snapshot() for backend in self.backends],
+        }
+    
+    async def _monitor_health(self):
+        while True:
+            await self.check_health()
+            # Poll more often while any backend is down so recovery is noticed quickly
+            all_up = all(backend.health.is_available() for backend in self.backends)
+            interval = self.health_interval if all_up else min(self.health_interval, 5.0)
+            await asyncio.sleep(interval)
+    
+    async def start(self):
+        """Start the background health monitor"""
+        if self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor_health())
     
     # ===============================================================================
     # CLEANUP
     # ===============================================================================
-    # Close HTTP client connection
+    # Stop background tasks and close HTTP client connection
     async def close(self):
-        """Close the HTTP client"""
+        """Stop the health monitor and close the HTTP client"""
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
         await self.client.aclose()
 
 # ===============================================================================
 # GLOBAL SERVICE INSTANCE
 # ===============================================================================
-# Single instance to be used throughout the application
+# Single instances to be used throughout the application
 ollama_service = OllamaService()
+generation_limiter = GenerationLimiter(
+    # Default: two parallel generations per backend
+    max_in_flight=int(os.getenv("OLLAMA_MAX_CONCURRENCY", str(2 * len(ollama_service.backends)))),
+    max_queue=int(os.getenv("OLLAMA_MAX_QUEUE", "32")),
+    max_queue_per_user=int(os.getenv("OLLAMA_MAX_QUEUE_PER_USER", "4")),
+    queue_timeout=float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))
+)
@@ -4,16 +4,191 @@ Handles JWT token verification and user authentication
 """
 import os
 import json
-from typing import Optional
+import logging
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from jose import jwt, jwk, JWTError
+from jose.backends.base import Key
 import httpx
 from functools import lru_cache
 
+logger = logging.getLogger(__name__)
+
 # Security scheme for Bearer tokens
 security = HTTPBearer()
 
+class JWKSCache:
+    """
+    In-process cache of Auth0 signing keys keyed by kid.
+
+    Keys are parsed into jose Key objects once per fetch, refreshed in the
+    background before they go stale, and refetched on an unknown kid (at most
+    once per min_refetch_interval). If Auth0 is unreachable, the last known
+    keys keep being served.
+    """
+
+    def __init__(self, jwks_url: str, algorithm: str, ttl: float, refresh_interval: float, min_refetch_interval: float):
+        self.jwks_url = jwks_url
+        self.algorithm = algorithm
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: Dict[str, Key] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(timeout=10.0)
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _is_fresh(self) -> bool:
+        return bool(self._keys) and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get_key(self, kid: str) -> Key:
+        """Return the parsed key for kid, fetching the JWKS only when needed"""
+        key = self._keys.get(kid)
+        if key is not None and self._is_fresh():
+            self.hits += 1
+            return key
+        self.misses += 1
+
+        # Stale cache or unknown kid (e.g. after a key rotation)
+        try:
+            await self.refresh()
+        except Exception as e:
+            if key is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"Unable to get signing key: {str(e)}"
+                )
+            logger.warning("JWKS refresh failed, using cached keys: %s", e)
+            return key
+
+        key = self._keys.get(kid, key)
+        if key is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Unable to find appropriate key"
+            )
+        return key
+
+    async def refresh(self, force: bool = False):
+        """Download the JWKS and replace the cached keys (rate limited unless forced)"""
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Another caller refreshed while we were waiting for the lock
+            if self._fetched_at >= requested_at:
+                return
+            if not force and requested_at - self._last_attempt < self.min_refetch_interval:
+                return
+            self._last_attempt = time.monotonic()
+
+            self.fetches += 1
+            try:
+                response = await self._client.get(self.jwks_url)
+                response.raise_for_status()
+                jwks = response.json()
+            except Exception:
+                self.fetch_errors += 1
+                raise
+
+            keys = {}
+            for key in jwks["keys"]:
+                if key.get("kty") != "RSA" or key.get("use", "sig") != "sig":
+                    continue
+                keys[key["kid"]] = jwk.construct(key, self.algorithm)
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"keys": len(self._keys), "hits": self.hits, "misses": self.misses,
+                "fetches": self.fetches, "fetch_errors": self.fetch_errors}
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh(force=True)
+            except Exception as e:
+                logger.warning("Background JWKS refresh failed: %s", e)
+
+    async def start(self):
+        """Fetch keys once (best effort) and start the background refresh task"""
+        try:
+            await self.refresh(force=True)
+        except Exception as e:
+            logger.warning("Initial JWKS fetch failed, will retry on demand: %s", e)
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        """Stop the background refresh task and close the HTTP client"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        await self._client.aclose()
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens: sha256(token) -> claims.
+
+    Entries expire at the token's own exp claim, so a cached token is never
+    accepted for longer than jwt.decode would have accepted it.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Return cached claims for a previously verified, unexpired token"""
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict):
+        """Remember verified claims until the token's exp"""
+        exp = claims.get("exp")
+        if self.max_size <= 0 or not isinstance(exp, (int, float)):
+            return
+        digest = self._digest(token)
+        self._entries[digest] = (claims, float(exp))
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
 class Auth0Service:
     def __init__(self):
         self.domain = os.getenv("AUTH0_DOMAIN")
@@ -21,45 +196,41 @@ class Auth0Service:
         self.issuer = os.getenv("AUTH0_ISSUER")
         self.algorithms = [os.getenv("AUTH0_ALGORITHMS", "RS256")]
         
+        self.token_cache = TokenCache(max_size=int(os.getenv("AUTH0_TOKEN_CACHE_SIZE", "1024")))
+        
         # Make Auth0 optional for development
         self.auth_enabled = all([self.domain, self.api_audience, self.issuer])
         
         if not self.auth_enabled:
-            print("⚠️  Auth0 disabled - missing configuration. Running without authentication.")
-    
-    async def get_signing_key(self, kid: str):
-        """Get the RSA key from Auth0's JWKS endpoint"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"https://{self.domain}/.well-known/jwks.json")
-                response.raise_for_status()
-                jwks = response.json()
-                
-                for key in jwks["keys"]:
-                    if key["kid"] == kid:
-                        return {
-                            "kty": key["kty"],
-                            "kid": key["kid"],
-                            "use": key["use"],
-                            "n": key["n"],
-                            "e": key["e"]
-                        }
-                        
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Unable to find appropriate key"
-                )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Unable to get signing key: {str(e)}"
+            logger.warning("Auth0 disabled - missing configuration. Running without authentication.")
+        else:
+            self.jwks_cache = JWKSCache(
+                jwks_url=f"https://{self.domain}/.well-known/jwks.json",
+                algorithm=self.algorithms[0],
+                ttl=float(os.getenv("AUTH0_JWKS_TTL", "3600")),
+                refresh_interval=float(os.getenv("AUTH0_JWKS_REFRESH_INTERVAL", "600")),
+                min_refetch_interval=float(os.getenv("AUTH0_JWKS_MIN_REFETCH_INTERVAL", "30")),
             )
     
+    async def get_signing_key(self, kid: str) -> Key:
+        """Get the parsed RSA key for a kid from the cached Auth0 JWKS"""
+        return await self.jwks_cache.get_key(kid)
+
+    async def start(self):
+        """Warm up the JWKS cache and start its background refresh"""
+        if self.auth_enabled:
+            await self.jwks_cache.start()
+
+    async def close(self):
+        """Stop background refresh and close the JWKS HTTP client"""
+        if self.auth_enabled:
+            await self.jwks_cache.close()
+    
     async def verify_token(self, token: str) -> dict:
         """Verify JWT token and return user information"""
         if not self.auth_enabled:
             # Return a mock user for development
-            print("🔧 Development mode: returning mock user")
+            logger.debug("Development mode: returning mock user")
             return {
                 "sub": "dev-user-123",
                 "email": "dev@example.com",
@@ -68,8 +239,13 @@ class Auth0Service:
                 "picture": "https://via.placeholder.com/150"
             }
             
+        # Fast path: token already verified and not yet expired
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+            
         try:
-            print(f"🔐 Verifying token for audience: {self.api_audience}")
+            logger.debug("Verifying token for audience: %s", self.api_audience)
             
             # Get token header to find the key ID
             unverified_header = jwt.get_unverified_header(token)
@@ -84,7 +260,7 @@ class Auth0Service:
             # Get the RSA key
             rsa_key = await self.get_signing_key(kid)
             
-            # Verify the token
+            # Verify the token (pure CPU once the key is cached)
             payload = jwt.decode(
                 token,
                 rsa_key,
@@ -93,23 +269,26 @@ class Auth0Service:
                 issuer=self.issuer
             )
             
-            print(f"✅ Token verified successfully for user: {payload.get('email', 'unknown')}")
+            logger.debug("Token verified for user: %s", payload.get("sub"))
+            self.token_cache.put(token, payload)
             return payload
             
+        except HTTPException:
+            raise
         except jwt.ExpiredSignatureError:
-            print("❌ Token expired")
+            logger.info("Token expired")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has expired"
             )
         except JWTError as e:
-            print(f"❌ JWT Error: {str(e)}")
+            logger.info("JWT error: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"Invalid token: {str(e)}"
             )
         except Exception as e:
-            print(f"❌ Token verification failed: {str(e)}")
+            logger.warning("Token verification failed: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"Token verification failed: {str(e)}"
@@ -0,0 +1,97 @@
+# ===============================================================================
+# CRUD AI CHAT APP - RESPONSE COMPRESSION
+# ===============================================================================
+# gzip / brotli for response bodies above a size threshold
+# Brotli is used when the `brotli` package is installed and the client accepts it
+#
+# Server-Sent Events are never compressed: a compressor buffers its input, which
+# would hold back streamed tokens. Other streamed bodies (NDJSON export) are
+# compressed chunk by chunk.
+
+import zlib
+from typing import Optional
+
+try:
+    import brotli  # optional: ~15-20% smaller than gzip for JSON
+except ImportError:
+    brotli = None
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=brotli_quality)
+            self._finish = self._impl.finish
+            self._compress = self._impl.process
+        else:
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._finish = self._impl.flush
+            self._compress = self._impl.compress
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        out = self._compress(data)
+        return out + self._finish() if last else out
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses the client accepts gzip/br for"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope) -> Optional[str]:
+        accept = dict(scope.get("headers", [])).get(b"accept-encoding", b"").decode("latin-1").lower()
+        if brotli is not None and "br" in accept:
+            return "br"
+        if "gzip" in accept:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        encoding = self._choose_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Decide on the first body chunk, once its size is known
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = dict(start_message.get("headers", []))
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if (
+                    b"content-encoding" in headers
+                    or content_type.startswith("text/event-stream")
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                new_headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+                new_headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+                await send({**start_message, "headers": new_headers})
+
+            await send({"type": "http.response.body", "body": compressor.compress(body, last=not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,178 @@
+# ===============================================================================
+# CRUD AI CHAT APP - CONVERSATION CONTEXT SERVICE
+# ===============================================================================
+# Builds the model context for a chat within a token budget
+# Older turns are folded into a rolling per-chat summary in the background
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal
+from models import Chat, Message
+from ai_service import ollama_service, generation_limiter, GenerationRejected
+
+logger = logging.getLogger(__name__)
+
+# ===============================================================================
+# CONFIGURATION
+# ===============================================================================
+# Budget for summary + history turns (the system prompt is small and fixed)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Upper bound on rows read per context build
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "200"))
+# Newest messages that are never folded into the summary
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "4"))
+
+SUMMARY_SYSTEM_PROMPT = """Du fasst Gespräche zwischen einem Nutzer und einem AI-Assistenten zusammen.
+Aktualisiere die bisherige Zusammenfassung mit den neuen Nachrichten.
+Behalte Fakten, Entscheidungen, offene Fragen und Vorlieben des Nutzers.
+Antworte nur mit der Zusammenfassung, höchstens 200 Wörter, auf Deutsch."""
+
+# ===============================================================================
+# TOKEN ESTIMATION
+# ===============================================================================
+# ~4 characters per token plus per-message overhead; no tokenizer dependency
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 4
+
+# ===============================================================================
+# CONTEXT BUILDING
+# ===============================================================================
+
+@dataclass
+class ChatContext:
+    messages: List[Dict[str, str]]
+    system_prompt: str
+    last_message_id: int  # Newest message in the chat, identifies the chat state
+    needs_summary: bool  # Unsummarized turns didn't fit: fold some in the background
+
+def _turn(msg: Message) -> Dict[str, str]:
+    return {"role": "user" if msg.is_from_user else "assistant", "content": msg.content}
+
+async def build_chat_context(db: AsyncSession, chat: Chat, base_system_prompt: str, up_to_message_id: Optional[int] = None) -> ChatContext:
+    """Pack the newest unsummarized messages into the token budget, newest first (optionally as of an earlier message)"""
+    query = select(Message).where(Message.chat_id == chat.id)
+    if chat.summary_message_id is not None:
+        query = query.where(Message.id > chat.summary_message_id)
+    if up_to_message_id is not None:
+        query = query.where(Message.id <= up_to_message_id)
+    candidates = (await db.execute(
+        query.order_by(Message.created_at.desc(), Message.id.desc()).limit(CONTEXT_MAX_MESSAGES + 1)
+    )).scalars().all()
+    
+    if not candidates:
+        raise HTTPException(status_code=400, detail="No messages to respond to")
+    
+    system_prompt = base_system_prompt
+    if chat.summary:
+        system_prompt += f"\n\nZusammenfassung des bisherigen Gesprächs:\n{chat.summary}"
+    
+    budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(system_prompt)
+    window: List[Message] = []
+    used = 0
+    for msg in candidates[:CONTEXT_MAX_MESSAGES]:
+        cost = estimate_tokens(msg.content)
+        if window and used + cost > budget:
+            break
+        window.append(msg)
+        used += cost
+    
+    if not any(msg.is_from_user for msg in window):
+        raise HTTPException(status_code=400, detail="No user message found")
+    
+    turns = [_turn(msg) for msg in reversed(window)]
+    # A single huge paste can exceed the budget on its own: keep its end
+    if used > budget and turns:
+        max_chars = max(budget, 1) * 4
+        turns[-1]["content"] = turns[-1]["content"][-max_chars:]
+    
+    return ChatContext(
+        messages=turns,
+        system_prompt=system_prompt,
+        last_message_id=candidates[0].id,
+        needs_summary=len(window) < len(candidates)
+    )
+
+# ===============================================================================
+# ROLLING SUMMARIES
+# ===============================================================================
+# Runs after a reply was produced, outside the request. One update per chat
+# at a time; each round folds the oldest unsummarized messages (up to the
+# context budget) into the summary, so long backlogs catch up over a few turns.
+
+_summarizing: Set[int] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+def schedule_summary_update(chat_id: int, user_id: int):
+    """Fold older turns into the chat summary in the background"""
+    if chat_id in _summarizing:
+        return
+    _summarizing.add(chat_id)
+    task = asyncio.create_task(_update_summary(chat_id, user_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _update_summary(chat_id: int, user_id: int):
+    try:
+        async with SessionLocal() as session:
+            chat = await session.get(Chat, chat_id)
+            if chat is None:
+                return
+            previous_summary, previous_id = chat.summary, chat.summary_message_id
+            
+            query = select(Message).where(Message.chat_id == chat_id)
+            if previous_id is not None:
+                query = query.where(Message.id > previous_id)
+            unsummarized = (await session.execute(
+                query.order_by(Message.created_at.asc(), Message.id.asc()).limit(CONTEXT_MAX_MESSAGES)
+            )).scalars().all()
+            await session.close()
+        
+        foldable = unsummarized[:-SUMMARY_KEEP_RECENT] if SUMMARY_KEEP_RECENT else unsummarized
+        batch: List[Message] = []
+        used = 0
+        for msg in foldable:
+            cost = estimate_tokens(msg.content)
+            if batch and used + cost > CONTEXT_TOKEN_BUDGET:
+                break
+            batch.append(msg)
+            used += cost
+        if not batch:
+            return
+        
+        conversation = [_turn(msg) for msg in batch]
+        instruction = "Neue Nachrichten oben. Aktualisierte Zusammenfassung:"
+        if previous_summary:
+            instruction = f"Bisherige Zusammenfassung:\n{previous_summary}\n\n{instruction}"
+        conversation.append({"role": "user", "content": instruction})
+        
+        async with generation_limiter.slot(user_id):
+            summary = await ollama_service.generate_response(
+                messages=conversation,
+                system_prompt=SUMMARY_SYSTEM_PROMPT
+            )
+        if not summary:
+            return
+        
+        async with SessionLocal() as session:
+            # Core UPDATE so updated_at (sidebar order) doesn't change.
+            # Guarded on the previous position in case another worker got there first.
+            guard = Chat.summary_message_id.is_(None) if previous_id is None else Chat.summary_message_id == previous_id
+            await session.execute(
+                update(Chat)
+                .where(Chat.id == chat_id, guard)
+                .values(summary=summary.strip(), summary_message_id=batch[-1].id, updated_at=Chat.updated_at)
+            )
+            await session.commit()
+    except GenerationRejected:
+        pass  # AI busy: try again after the next reply
+    except Exception:
+        logger.exception("Error updating chat summary for chat %s", chat_id)
+    finally:
+        _summarizing.discard(chat_id)
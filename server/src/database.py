@@ -2,13 +2,19 @@
 # CRUD AI CHAT APP - DATABASE CONFIGURATION
 # ===============================================================================
 # SQLAlchemy database setup and connection management
-# Handles database URL configuration and session creation
+# Handles database URL configuration and async session creation
 
+import logging
 import os
+import time
+from typing import AsyncIterator
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base  
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from migrations import run_migrations
+from metrics import record_db_query
+
+logger = logging.getLogger(__name__)
 
 # ===============================================================================
 # ENVIRONMENT SETUP
@@ -19,27 +25,103 @@ load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 # ===============================================================================
 # DATABASE URL CONFIGURATION
 # ===============================================================================
-# Using SQLite for simplicity (file-based database)
-DATABASE_URL = "sqlite:///./crudai.db"
+# DATABASE_URL selects the backend; defaults to a local SQLite file.
+# Sync-style URLs are mapped to the async drivers:
+#   sqlite:///./crudai.db             -> sqlite+aiosqlite:///./crudai.db
+#   postgres://user:pw@host:5432/db   -> postgresql+asyncpg://user:pw@host:5432/db
+def to_async_url(url: str) -> str:
+    """Map a sync database URL to its async driver equivalent"""
+    for prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
 
-# PostgreSQL configuration (for future use with Docker):
-# DB_HOST = os.getenv("DB_HOST")
-# DB_PORT = os.getenv("DB_PORT") 
-# DB_USERNAME = os.getenv("DB_USERNAME")
-# DB_PASSWORD = os.getenv("DB_PASSWORD")
-# DB_DATABASE = os.getenv("DB_DATABASE")
-# DATABASE_URL = f"postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+DATABASE_URL = to_async_url(os.getenv("DATABASE_URL", "sqlite:///./crudai.db"))
 
 # ===============================================================================
 # DATABASE ENGINE AND SESSION SETUP
 # ===============================================================================
-# Create database engine and session factory
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Server databases get a tunable connection pool; SQLite gets per-connection
+# PRAGMAs (WAL, synchronous=NORMAL, busy timeout, mmap) so concurrent readers
+# and a writer don't stall each other with "database is locked".
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+def create_engine_from_env(url: str):
+    """Create the async engine for url using pool/PRAGMA settings from the environment"""
+    if url.startswith("sqlite"):
+        busy_timeout_ms = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+        engine = create_async_engine(url, connect_args={"timeout": busy_timeout_ms / 1000})
+        
+        pragmas = [
+            "PRAGMA foreign_keys=ON",  # needed for ON DELETE CASCADE
+            f"PRAGMA busy_timeout={busy_timeout_ms}",
+            f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+        ]
+        if _env_bool("SQLITE_WAL", True):
+            pragmas.insert(0, "PRAGMA journal_mode=WAL")
+        
+        @event.listens_for(engine.sync_engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+        
+        return engine
+    
+    return create_async_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+    )
+
+def instrument_engine(engine):
+    """Time every query for /metrics and the per-request Server-Timing header"""
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+    
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        record_db_query(statement, time.perf_counter() - conn.info.pop("query_started", time.perf_counter()))
+    
+    return engine
+
+# Create async database engine and session factory.
+# expire_on_commit=False keeps ORM objects readable after commit, so routes can
+# return them without triggering a lazy (blocking) reload.
+engine = instrument_engine(create_engine_from_env(DATABASE_URL))
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# ===============================================================================
+# FASTAPI DEPENDENCY
+# ===============================================================================
+# One AsyncSession per request, always closed when the request finishes
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding an async database session"""
+    async with SessionLocal() as session:
+        yield session
 
 # ===============================================================================
 # DATABASE INITIALIZATION
 # ===============================================================================
-# Create tables only if they don't exist (preserve existing data)
-Base.metadata.create_all(bind=engine)
-print("Datenbank initialisiert - Tabellen erstellt falls sie nicht existieren!")
\ No newline at end of file
+# Apply pending schema migrations (preserve existing data), see migrations.py.
+# Called from the application lifespan since DDL needs a running event loop.
+async def init_db():
+    """Create or upgrade the database schema"""
+    await run_migrations(engine)
+    logger.info("Datenbank initialisiert - Schema ist aktuell!")
+
+async def close_db():
+    """Dispose the engine's connection pool"""
+    await engine.dispose()
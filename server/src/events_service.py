@@ -0,0 +1,205 @@
+# ===============================================================================
+# CRUD AI CHAT APP - LIVE EVENTS SERVICE
+# ===============================================================================
+# Per-user pub/sub behind the /ws push channel
+# Routes publish events; every open WebSocket of that user receives them
+#
+# Events are JSON objects with a "type":
+#   message.created  {"message": MessageResponse}
+#   ai.token         {"chat_id", "content"}   streamed generation chunks (+ "job_id" from job workers)
+#   chat.created     {"chat": ChatResponse}
+#   chat.updated     {"chat": ChatResponse}
+#   chat.deleted     {"chat_id"}
+#   job.updated      {"job": JobResponse}     background generation state changes
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[int, dict], None]
+
+# ===============================================================================
+# BROKERS
+# ===============================================================================
+# In-process by default (one worker); Redis pub/sub when EVENTS_REDIS_URL is set,
+# so an event published on one worker reaches sockets held by the others.
+
+class InMemoryEventBroker:
+    """Hands events straight to the local hub"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, user_id: int, event: dict):
+        if self._deliver is not None:
+            self._deliver(user_id, event)
+
+    async def close(self):
+        self._deliver = None
+
+class RedisEventBroker:
+    """Fan-out through one Redis channel (requires the `redis` package)"""
+
+    def __init__(self, url: str, channel: str = "crudai:events"):
+        import redis.asyncio as redis  # optional dependency, only needed when configured
+        self._redis = redis.from_url(url)
+        self.channel = channel
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        self._listener = asyncio.create_task(self._listen(deliver))
+
+    async def publish(self, user_id: int, event: dict):
+        await self._redis.publish(self.channel, json.dumps({"user_id": user_id, "event": event}))
+
+    async def _listen(self, deliver: Deliver):
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            payload = json.loads(message["data"])
+                            deliver(payload["user_id"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Event subscription lost, reconnecting: %s", e)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        await self._redis.close()
+
+# ===============================================================================
+# EVENT HUB
+# ===============================================================================
+# One bounded queue per open socket. A socket that can't keep up gets a final
+# "resync" event and is dropped from delivery instead of buffering without limit;
+# the client reconnects and reloads over REST.
+#
+# Publishing only puts the event on an outbox that a background task hands to
+# the broker, so a generation streaming tokens never waits for a Redis round
+# trip. Token events queued back to back for the same chat are merged into one;
+# when the outbox is full further tokens are dropped (the saved message follows
+# as message.created), other events wait for room.
+
+# Events waiting for the broker
+OUTBOX_SIZE = 1024
+
+class EventHub:
+    def __init__(self, broker, queue_size: int = 256, outbox_size: int = OUTBOX_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.outbox_size = outbox_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._outbox: Optional[asyncio.Queue] = None  # Created in start(), on the serving loop
+        self._sender: Optional[asyncio.Task] = None
+        self.dropped_tokens = 0
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def deliver(self, user_id: int, event: dict):
+        """Put an event on every local socket queue of the user (called by the broker)"""
+        for queue in list(self._subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.unsubscribe(user_id, queue)
+                queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+    async def publish(self, user_id: int, event_type: str, **data):
+        """Send an event to all of the user's sockets; never raises into the caller or waits on the broker"""
+        event = {"type": event_type, **data}
+        if self._outbox is None:
+            # Not started (scripts, tests): straight to the broker
+            await self._send(user_id, event)
+        elif event_type == "ai.token":
+            try:
+                self._outbox.put_nowait((user_id, event))
+            except asyncio.QueueFull:
+                self.dropped_tokens += 1
+        else:
+            await self._outbox.put((user_id, event))
+
+    async def _send(self, user_id: int, event: dict):
+        try:
+            await self.broker.publish(user_id, event)
+        except Exception as e:
+            logger.warning("Failed to publish %s event: %s", event["type"], e)
+
+    async def _run_sender(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            for item in _merge_tokens(batch):
+                if item is None:
+                    return
+                await self._send(*item)
+
+    async def start(self):
+        await self.broker.start(self.deliver)
+        self._outbox = asyncio.Queue(maxsize=self.outbox_size)
+        self._sender = asyncio.create_task(self._run_sender())
+
+    async def close(self):
+        if self._sender is not None:
+            # Flush what was published before shutdown, then stop
+            await self._outbox.put(None)
+            try:
+                await asyncio.wait_for(self._sender, 5.0)
+            except asyncio.TimeoutError:
+                logger.warning("Dropped unsent events on shutdown")
+            self._sender = None
+            self._outbox = None
+        await self.broker.close()
+
+def _merge_tokens(batch: list) -> list:
+    """Join consecutive ai.token events of the same user, chat and job"""
+    merged = []
+    for item in batch:
+        previous = merged[-1] if merged else None
+        if (item is not None and previous is not None and item[1]["type"] == "ai.token" and previous[1]["type"] == "ai.token"
+                and item[0] == previous[0] and {**item[1], "content": ""} == {**previous[1], "content": ""}):
+            merged[-1] = (item[0], {**previous[1], "content": previous[1]["content"] + item[1]["content"]})
+        else:
+            merged.append(item)
+    return merged
+
+def _create_broker():
+    redis_url = os.getenv("EVENTS_REDIS_URL")
+    if redis_url:
+        return RedisEventBroker(redis_url)
+    return InMemoryEventBroker()
+
+event_hub = EventHub(_create_broker(), queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "256")))
@@ -0,0 +1,87 @@
+# ===============================================================================
+# CRUD AI CHAT APP - CONDITIONAL GET AND FAST LIST RESPONSES
+# ===============================================================================
+# ETag / Last-Modified validators built from the chat aggregates, 304 handling,
+# and pre-serialized JSON for the hot list endpoints (GET /chats, /messages)
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, List, Mapping, Optional
+from fastapi import Request, Response
+
+try:
+    import orjson  # optional: several times faster than json for large lists
+except ImportError:
+    orjson = None
+
+# ===============================================================================
+# VALIDATORS
+# ===============================================================================
+# The ETag is a hash of whatever identifies the state of the resource (counts,
+# newest timestamps) plus the query string, so each page has its own tag.
+# "private, no-cache": browsers keep the response but revalidate every time,
+# which turns an unchanged history load into a 304 without a body.
+
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # Weak comparison: W/"x" and "x" match
+        return "*" in tags or etag in tags or etag[2:] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    # HTTP dates have one-second resolution: a change later in the same second
+    # would look unmodified, so only advertise seconds that are already over
+    if last_modified is not None and datetime.utcnow() - last_modified >= timedelta(seconds=1):
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
+
+# ===============================================================================
+# FAST JSON LISTS
+# ===============================================================================
+# Rows selected as plain columns (no ORM objects) are dumped straight to JSON,
+# skipping the per-row Pydantic validation FastAPI does for response_model.
+# Output matches the declared response models (ISO timestamps, compact).
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dump_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+def json_list_response(rows: Iterable[Any], sub_response: Response, headers: Mapping[str, str]) -> Response:
+    """200 JSON response for Row objects, keeping headers set on the route's Response parameter"""
+    items: List[dict] = [row._asdict() for row in rows]
+    response = Response(content=dump_json(items), media_type="application/json", headers=dict(headers))
+    for name, value in sub_response.headers.items():
+        if name != "content-length":
+            response.headers[name] = value
+    return response
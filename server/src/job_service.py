@@ -0,0 +1,327 @@
+# ===============================================================================
+# CRUD AI CHAT APP - GENERATION JOB SERVICE
+# ===============================================================================
+# Durable queue of AI generations in the generation_jobs table
+# Survives client disconnects, proxy timeouts and server restarts
+#
+# Workers claim a job by setting a lease (token + expiry) and keep renewing it
+# while they run. A job whose lease ran out - worker crashed, server killed - is
+# claimed again by any worker and re-run. On a clean shutdown running jobs are
+# handed back to the queue right away. The answer is saved in the same
+# transaction that marks the job succeeded, so a re-run never answers twice.
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal
+from models import GenerationJob
+from schemas import JobResponse
+from events_service import event_hub
+
+logger = logging.getLogger(__name__)
+
+# ===============================================================================
+# CONFIGURATION
+# ===============================================================================
+# Worker tasks per process (0 = this process only enqueues, see job_worker.py)
+GENERATION_JOB_WORKERS = int(os.getenv("GENERATION_JOB_WORKERS", "2"))
+# Seconds a claim stays valid without renewal (renewed every third of it)
+GENERATION_JOB_LEASE = float(os.getenv("GENERATION_JOB_LEASE", "30"))
+# Idle workers look for new jobs this often (enqueues in-process wake them at once)
+GENERATION_JOB_POLL_INTERVAL = float(os.getenv("GENERATION_JOB_POLL_INTERVAL", "2"))
+# Runs per job before it is marked failed (retries back off 2, 4, 8... seconds, up to a minute)
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_MAX = 60.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobFailed(Exception):
+    """Permanent failure: mark the job failed without retrying"""
+
+class JobRetry(Exception):
+    """Transient condition (e.g. generation queue full): put the job back and retry later"""
+
+    def __init__(self, delay: float):
+        super().__init__(f"retry in {delay}s")
+        self.delay = delay
+
+Executor = Callable[[GenerationJob], Awaitable[None]]
+
+def _claimable(now: datetime):
+    return or_(
+        and_(GenerationJob.status == QUEUED, or_(GenerationJob.available_at.is_(None), GenerationJob.available_at <= now)),
+        and_(GenerationJob.status == RUNNING, GenerationJob.lease_expires_at < now),
+    )
+
+async def publish_job(job: GenerationJob):
+    """Push the job's state to the owner's live connections"""
+    await event_hub.publish(job.user_id, "job.updated", job=JobResponse.model_validate(job).model_dump(mode="json"))
+
+# ===============================================================================
+# JOB RUNNER
+# ===============================================================================
+
+class JobRunner:
+    def __init__(self, workers: int, lease: float, poll_interval: float, max_attempts: int):
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup: Optional[asyncio.Event] = None  # Created in start(), on the serving loop
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[int, asyncio.Task] = {}  # job id -> executing task (this process)
+        self._abandoned: Set[int] = set()  # cancelled or lease lost: don't touch the row again
+        self._closing = False
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    # ---- Submitting and cancelling (called from requests) ----
+
+    async def enqueue(self, db: AsyncSession, chat_id: int, user_id: int, trigger_message_id: int) -> Tuple[GenerationJob, bool]:
+        """Job answering this chat state; returns (job, created). A failed or cancelled one is restarted."""
+        # Newest message is a job's own answer: the chat is answered already, that's the job
+        answered = await db.execute(
+            select(GenerationJob).where(GenerationJob.chat_id == chat_id, GenerationJob.status == SUCCEEDED,
+                                        GenerationJob.result_message_id == trigger_message_id)
+        )
+        answering = answered.scalars().first()
+        if answering is not None:
+            return answering, False
+
+        existing = await self._find(db, chat_id, trigger_message_id)
+        if existing is not None:
+            if existing.status not in (FAILED, CANCELLED):
+                return existing, False
+            await db.execute(
+                update(GenerationJob).where(GenerationJob.id == existing.id, GenerationJob.status.in_((FAILED, CANCELLED)))
+                .values(status=QUEUED, attempts=0, error=None, lease_token=None, lease_expires_at=None,
+                        available_at=None, started_at=None, finished_at=None)
+            )
+            await db.commit()
+            await db.refresh(existing)
+            self._notify()
+            await publish_job(existing)
+            return existing, True
+
+        job = GenerationJob(chat_id=chat_id, user_id=user_id, trigger_message_id=trigger_message_id, status=QUEUED, attempts=0)
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Submitted concurrently: the other request created it
+            await db.rollback()
+            return await self._find(db, chat_id, trigger_message_id), False
+        await db.refresh(job)
+        self._notify()
+        await publish_job(job)
+        return job, True
+
+    async def _find(self, db: AsyncSession, chat_id: int, trigger_message_id: int) -> Optional[GenerationJob]:
+        result = await db.execute(
+            select(GenerationJob).where(GenerationJob.chat_id == chat_id, GenerationJob.trigger_message_id == trigger_message_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def cancel(self, db: AsyncSession, job: GenerationJob) -> GenerationJob:
+        """Cancel a queued or running job (a worker elsewhere notices on its next lease renewal)"""
+        await db.execute(
+            update(GenerationJob).where(GenerationJob.id == job.id, GenerationJob.status.in_(ACTIVE_STATUSES))
+            .values(status=CANCELLED, finished_at=datetime.utcnow(), lease_token=None, lease_expires_at=None)
+        )
+        await db.commit()
+        await db.refresh(job)
+        task = self._running.get(job.id)
+        if task is not None and job.status == CANCELLED:
+            self._abandoned.add(job.id)
+            task.cancel()
+        await publish_job(job)
+        return job
+
+    async def complete(self, session: AsyncSession, job: GenerationJob, result_message_id: int) -> bool:
+        """Mark the job succeeded inside the caller's transaction; False if it was cancelled or taken over"""
+        result = await session.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job.id, GenerationJob.status == RUNNING, GenerationJob.lease_token == job.lease_token)
+            .values(status=SUCCEEDED, result_message_id=result_message_id, finished_at=datetime.utcnow(),
+                    lease_token=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    # ---- Workers ----
+
+    def _notify(self):
+        """Wake an idle worker of this process (workers elsewhere find the job on their next poll)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self, execute: Executor, workers: Optional[int] = None):
+        count = self.workers if workers is None else workers
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker(execute)) for _ in range(count)]
+        if count:
+            logger.info("Started %d generation job workers", count)
+
+    async def close(self):
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, execute: Executor):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to claim generation job: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job, execute)
+
+    async def _claim(self) -> Optional[GenerationJob]:
+        """Take the oldest claimable job (compare-and-set on its status and lease)"""
+        async with SessionLocal() as session:
+            now = datetime.utcnow()
+            candidate = (await session.execute(
+                select(GenerationJob.id).where(_claimable(now)).order_by(GenerationJob.id).limit(1)
+            )).scalar_one_or_none()
+            if candidate is None:
+                return None
+
+            token = uuid.uuid4().hex
+            claimed = await session.execute(
+                update(GenerationJob).where(GenerationJob.id == candidate, _claimable(now))
+                .values(status=RUNNING, lease_token=token, lease_expires_at=now + timedelta(seconds=self.lease),
+                        attempts=GenerationJob.attempts + 1, started_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            if claimed.rowcount != 1:
+                self._notify()  # Another worker won it; look again right away
+                return None
+            job = (await session.execute(
+                select(GenerationJob).where(GenerationJob.id == candidate).execution_options(populate_existing=True)
+            )).scalar_one()
+
+        if job.attempts > self.max_attempts:
+            await self._release(job, status=FAILED, error="Too many attempts")
+            return None
+        await publish_job(job)
+        return job
+
+    async def _run(self, job: GenerationJob, execute: Executor):
+        task = asyncio.ensure_future(execute(job))
+        self._running[job.id] = task
+        heartbeat = asyncio.ensure_future(self._heartbeat(job, task))
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._closing:
+                # Shutting down: hand the job back so the next start resumes it
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                if job.id not in self._abandoned:
+                    await self._release(job, status=QUEUED, attempts=job.attempts - 1)
+                raise
+            logger.info("Generation job %s cancelled", job.id)
+        except JobRetry as e:
+            await self._release(job, status=QUEUED, attempts=job.attempts - 1, available_at=self._after(e.delay))
+        except JobFailed as e:
+            await self._release(job, status=FAILED, error=str(e))
+        except Exception as e:
+            logger.warning("Generation job %s failed (attempt %d): %s", job.id, job.attempts, e)
+            if job.attempts >= self.max_attempts:
+                await self._release(job, status=FAILED, error="Failed to generate AI response")
+            else:
+                delay = min(2.0 ** job.attempts, RETRY_BACKOFF_MAX)
+                await self._release(job, status=QUEUED, available_at=self._after(delay))
+        else:
+            # Succeeded, or lost the job to a cancel while saving: report whatever it is now
+            await self._publish_latest(job.id)
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job.id, None)
+            self._abandoned.discard(job.id)
+
+    @staticmethod
+    def _after(seconds: float) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=seconds)
+
+    async def _heartbeat(self, job: GenerationJob, task: asyncio.Task):
+        """Renew the lease; stop the generation if the job was cancelled or taken over"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                async with SessionLocal() as session:
+                    renewed = await session.execute(
+                        update(GenerationJob)
+                        .where(GenerationJob.id == job.id, GenerationJob.status == RUNNING, GenerationJob.lease_token == job.lease_token)
+                        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.warning("Failed to renew lease of generation job %s: %s", job.id, e)
+                continue
+            if renewed.rowcount != 1:
+                self._abandoned.add(job.id)
+                task.cancel()
+                return
+
+    async def _release(self, job: GenerationJob, status: str, **values):
+        """Give up our claim: back to the queue or finished, if we still hold it"""
+        if status in FINISHED_STATUSES:
+            values["finished_at"] = datetime.utcnow()
+        try:
+            async with SessionLocal() as session:
+                await session.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job.id, GenerationJob.status == RUNNING, GenerationJob.lease_token == job.lease_token)
+                    .values(status=status, lease_token=None, lease_expires_at=None, **values)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as e:
+            # The lease runs out and another worker picks the job up
+            logger.warning("Failed to update generation job %s: %s", job.id, e)
+            return
+        if status == QUEUED:
+            self._notify()
+        await self._publish_latest(job.id)
+
+    async def _publish_latest(self, job_id: int):
+        try:
+            async with SessionLocal() as session:
+                job = await session.get(GenerationJob, job_id)
+        except Exception as e:
+            logger.warning("Failed to load generation job %s: %s", job_id, e)
+            return
+        if job is not None:
+            await publish_job(job)
+
+job_runner = JobRunner(
+    workers=GENERATION_JOB_WORKERS,
+    lease=GENERATION_JOB_LEASE,
+    poll_interval=GENERATION_JOB_POLL_INTERVAL,
+    max_attempts=GENERATION_JOB_MAX_ATTEMPTS,
+)
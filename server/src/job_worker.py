@@ -0,0 +1,47 @@
+# ===============================================================================
+# CRUD AI CHAT APP - STANDALONE GENERATION JOB WORKER
+# ===============================================================================
+# Runs background generation jobs beside the API instead of inside it
+# Start any number of these against the same database; set GENERATION_JOB_WORKERS=0
+# on the API processes to keep generation out of them entirely.
+#
+# Run with: python job_worker.py
+# Stops on SIGINT/SIGTERM, handing running jobs back to the queue.
+
+import asyncio
+import logging
+import signal
+from dotenv import load_dotenv
+from logging_config import setup_logging
+
+load_dotenv()
+setup_logging()
+logger = logging.getLogger("job_worker")
+
+from database import init_db, close_db
+from ai_service import ollama_service
+from events_service import event_hub
+from job_service import job_runner
+from routes import execute_generation_job
+
+async def main():
+    await init_db()
+    await ollama_service.start()
+    await event_hub.start()
+    # At least one worker, whatever the API processes are configured with
+    await job_runner.start(execute_generation_job, workers=max(job_runner.workers, 1))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Stopping generation job workers")
+    await job_runner.close()
+    await event_hub.close()
+    await ollama_service.close()
+    await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+# ===============================================================================
+# CRUD AI CHAT APP - LOGGING CONFIGURATION
+# ===============================================================================
+# Structured (JSON) logging with request IDs, written off the event loop
+# Call setup_logging() once at startup, then use logging.getLogger(__name__)
+#
+# Environment:
+#   LOG_LEVEL=INFO                                  root level
+#   LOG_LEVELS=auth_service=WARNING,routes=DEBUG    per-module overrides (httpx defaults to WARNING)
+#   LOG_FORMAT=json | text                          text is easier to read locally
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# ===============================================================================
+# REQUEST ID
+# ===============================================================================
+# Taken from the X-Request-ID header (or generated) and attached to every log
+# record emitted while handling the request, including background work it starts.
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+class RequestIdMiddleware:
+    """ASGI middleware: set the request ID context and echo it as X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers", [])).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming[:64] if incoming else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request ID (runs in the caller's context)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+# ===============================================================================
+# FORMATTERS
+# ===============================================================================
+
+# Attributes every LogRecord has; anything else came in via `extra=`
+# (except uvicorn's color_message, an ANSI-colored copy of msg)
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "color_message"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return super().format(record)
+
+# ===============================================================================
+# SETUP
+# ===============================================================================
+# Loggers only put records on an in-memory queue; a listener thread formats
+# and writes them, so a slow stdout never blocks the event loop.
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Before LOG_LEVELS overrides: httpx logs every Ollama/JWKS request at INFO
+DEFAULT_LEVELS = {"httpx": "WARNING"}
+# Uvicorn installs its own stderr handlers; send its records through ours instead
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Keep exc_info on queued records (the stdlib prepare() folds the traceback into msg)"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Message and traceback text resolved now, while args and frames are current
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+def setup_logging():
+    """Configure the root logger from LOG_LEVEL / LOG_LEVELS / LOG_FORMAT (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "text" else JsonFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    for name, level in DEFAULT_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+    for override in os.getenv("LOG_LEVELS", "").split(","):
+        if "=" in override:
+            name, level = override.split("=", 1)
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -4,29 +4,67 @@
 # FastAPI application with CORS configuration and route setup
 # Handles database initialization and serves the API endpoints
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import logging
 import os
-from routes import router
+from logging_config import setup_logging, RequestIdMiddleware
+from compression import CompressionMiddleware
 
 # ===============================================================================
 # ENVIRONMENT CONFIGURATION
 # ===============================================================================
-# Load environment variables from .env file
+# Load environment variables from .env file, then configure logging before the
+# services imported below log their startup messages
 load_dotenv()
+setup_logging()
+logger = logging.getLogger("main")
+
+from routes import router, execute_generation_job
+from database import init_db, close_db
+from ai_service import ollama_service, generation_limiter
+from auth_service import auth_service
+from response_cache import response_cache
+from events_service import event_hub
+from job_service import job_runner
+import metrics
 
 # Validate Auth0 configuration
 required_auth_vars = ["AUTH0_DOMAIN", "AUTH0_API_AUDIENCE", "AUTH0_ISSUER"]
 missing_vars = [var for var in required_auth_vars if not os.getenv(var)]
 
 if missing_vars:
-    print(f"⚠️  Warning: Missing Auth0 environment variables: {missing_vars}")
-    print("   Auth0 authentication will not work until these are configured.")
-    print("   Copy .env.example to .env and fill in your Auth0 values.")
+    logger.warning(
+        "Missing Auth0 environment variables: %s. Auth0 authentication will not work until these "
+        "are configured - copy .env.example to .env and fill in your Auth0 values.", missing_vars
+    )
 else:
-    print("✅ Auth0 configuration loaded successfully")
+    logger.info("Auth0 configuration loaded successfully")
+
+# ===============================================================================
+# APPLICATION LIFESPAN
+# ===============================================================================
+# Startup: migrate the database, warm the JWKS cache, start the Ollama health monitor,
+# the live events broker and the generation job workers.
+# Shutdown: stop background tasks (running jobs go back to the queue), release DB
+# pool and HTTP clients.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await auth_service.start()
+    await ollama_service.start()
+    await event_hub.start()
+    await job_runner.start(execute_generation_job)
+    yield
+    await job_runner.close()
+    await event_hub.close()
+    await auth_service.close()
+    await ollama_service.close()
+    await close_db()
 
 # ===============================================================================
 # FASTAPI APPLICATION SETUP
@@ -35,7 +73,8 @@ else:
 app = FastAPI(
     title="CRUD AI Chat API with Auth0",
     description="Full-stack chat application with AI integration and Auth0 authentication",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # ===============================================================================
@@ -56,8 +95,58 @@ app.add_middleware(
     allow_credentials=True,  # Important for Auth0 tokens
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Before-Cursor", "X-After-Cursor", "X-Request-ID"],  # Pagination cursors, log correlation
+)
+
+# ===============================================================================
+# RESPONSE COMPRESSION
+# ===============================================================================
+# gzip (or brotli, if installed) for bodies above COMPRESSION_MIN_SIZE bytes
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
 )
 
+# ===============================================================================
+# METRICS
+# ===============================================================================
+# Request latency per route, DB time per request (also sent as Server-Timing),
+# plus gauges read from the caches and the AI queue on every scrape.
+app.add_middleware(metrics.MetricsMiddleware)
+# Added last so it wraps everything: every log line of a request carries its ID
+app.add_middleware(RequestIdMiddleware)
+
+def _stat(source, key: str):
+    return lambda: source().get(key) if source() is not None else None
+
+_token_stats = lambda: auth_service.token_cache.stats()
+_jwks_stats = lambda: auth_service.jwks_cache.stats() if auth_service.auth_enabled else None
+_cache_stats = lambda: response_cache.stats() if response_cache else None
+
+metrics.gauge("auth_token_cache_hits_total", "Verified-token cache hits", _stat(_token_stats, "hits"), kind="counter")
+metrics.gauge("auth_token_cache_misses_total", "Verified-token cache misses", _stat(_token_stats, "misses"), kind="counter")
+metrics.gauge("auth_jwks_cache_hits_total", "JWKS lookups served from cache", _stat(_jwks_stats, "hits"), kind="counter")
+metrics.gauge("auth_jwks_cache_misses_total", "JWKS lookups needing a refresh", _stat(_jwks_stats, "misses"), kind="counter")
+metrics.gauge("auth_jwks_fetches_total", "JWKS downloads from Auth0", _stat(_jwks_stats, "fetches"), kind="counter")
+metrics.gauge("auth_jwks_fetch_errors_total", "Failed JWKS downloads", _stat(_jwks_stats, "fetch_errors"), kind="counter")
+metrics.gauge("ai_response_cache_hits_total", "AI response cache hits", _stat(_cache_stats, "hits"), kind="counter")
+metrics.gauge("ai_response_cache_misses_total", "AI response cache misses", _stat(_cache_stats, "misses"), kind="counter")
+metrics.gauge("ai_generations_in_flight", "Generations currently running", lambda: generation_limiter.in_flight)
+metrics.gauge("ai_generations_queued", "Generations waiting for a slot", lambda: generation_limiter.queued)
+metrics.gauge("ai_generations_rejected_total", "Generations rejected (queue full / per-user limit)", lambda: generation_limiter.rejected, kind="counter")
+metrics.gauge("ai_generations_timed_out_total", "Generations that timed out in the queue", lambda: generation_limiter.timed_out, kind="counter")
+metrics.gauge("ai_backends_available", "Model backends currently believed healthy",
+              lambda: sum(backend.health.is_available() for backend in ollama_service.backends))
+metrics.gauge("ws_connections", "Open live-update WebSockets in this worker", lambda: event_hub.connection_count)
+metrics.gauge("events_dropped_tokens_total", "AI token events dropped because the event outbox was full", lambda: event_hub.dropped_tokens, kind="counter")
+metrics.gauge("ai_jobs_running", "Background generation jobs running in this worker", lambda: job_runner.running_count)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ===============================================================================
 # ROOT ENDPOINT
 # ===============================================================================
@@ -69,6 +158,9 @@ def root():
         'message': 'CRUD AI Chat API with Auth0',
         'version': '2.0.0',
         'auth0_status': auth_status,
+        'ai_status': ollama_service.snapshot(),
+        'ai_queue': generation_limiter.stats(),
+        'ai_response_cache': response_cache.stats() if response_cache else None,
         'features': ['Chat Management', 'AI Integration', 'User Authentication']
     }
 
@@ -83,5 +175,6 @@ app.include_router(router)
 # ===============================================================================
 # Run with: uvicorn main:app --reload --host 0.0.0.0 --port 8000
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    # log_config=None: keep the handlers set up by setup_logging()
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info", log_config=None)
     
\ No newline at end of file
@@ -0,0 +1,234 @@
+# ===============================================================================
+# CRUD AI CHAT APP - METRICS
+# ===============================================================================
+# Prometheus-style counters and histograms, exposed as text on GET /metrics
+# Request middleware, per-request DB timing and Server-Timing headers
+#
+# Kept dependency-free (no prometheus_client): one process-local registry,
+# rendered in the Prometheus text exposition format. With several workers,
+# each worker reports its own numbers.
+
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# ===============================================================================
+# METRIC TYPES
+# ===============================================================================
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self._values.items()]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            for bound, count in zip(self.buckets, state):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+class Gauge:
+    """Value read at scrape time from a callback (e.g. queue length)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], Optional[float]], kind: str = "gauge"):
+        self.name = name
+        self.description = description
+        self.read = read
+        self.kind = kind  # "counter" for totals kept elsewhere (e.g. cache hits)
+
+    def samples(self) -> List[str]:
+        value = self.read()
+        return [] if value is None else [f"{self.name} {value}"]
+
+# ===============================================================================
+# REGISTRY
+# ===============================================================================
+
+_registry: Dict[str, object] = {}
+
+def _register(metric):
+    _registry[metric.name] = metric
+    return metric
+
+def counter(name: str, description: str, labels: Iterable[str] = ()) -> Counter:
+    return _register(Counter(name, description, labels))
+
+def histogram(name: str, description: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, description, labels, buckets))
+
+def gauge(name: str, description: str, read: Callable[[], Optional[float]], kind: str = "gauge") -> Gauge:
+    return _register(Gauge(name, description, read, kind))
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry.values():
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+# ===============================================================================
+# APPLICATION METRICS
+# ===============================================================================
+# Defined here so every module records into the same names.
+
+HTTP_REQUEST_SECONDS = histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+HTTP_REQUEST_DB_SECONDS = histogram("http_request_db_seconds", "Time spent in database queries per request", ("route",))
+HTTP_REQUEST_DB_QUERIES = histogram("http_request_db_queries", "Database queries per request", ("route",),
+                                    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50))
+DB_QUERY_SECONDS = histogram("db_query_duration_seconds", "Database query latency", ("operation",))
+
+AI_QUEUE_WAIT_SECONDS = histogram("ai_queue_wait_seconds", "Time AI requests waited for a generation slot")
+LLM_REQUEST_SECONDS = histogram("llm_request_duration_seconds", "Total model call time by backend", ("backend", "mode"),
+                                buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+LLM_TTFT_SECONDS = histogram("llm_time_to_first_token_seconds", "Streaming time to first token by backend", ("backend",),
+                             buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+LLM_TOKENS_PER_SECOND = histogram("llm_tokens_per_second", "Generation speed reported by the backend", ("backend",),
+                                  buckets=(1, 5, 10, 20, 30, 50, 75, 100, 200))
+LLM_PROMPT_TOKENS = counter("llm_prompt_tokens_total", "Prompt tokens evaluated by the backend", ("backend",))
+LLM_COMPLETION_TOKENS = counter("llm_completion_tokens_total", "Tokens generated by the backend", ("backend",))
+LLM_ERRORS = counter("llm_errors_total", "Failed model calls by backend", ("backend",))
+
+def record_llm_usage(backend: str, result: dict):
+    """Record token counts and speed from an Ollama final chunk / OpenAI usage block"""
+    usage = result.get("usage") or {}
+    prompt_tokens = result.get("prompt_eval_count", usage.get("prompt_tokens"))
+    completion_tokens = result.get("eval_count", usage.get("completion_tokens"))
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, backend=backend)
+    if completion_tokens:
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, backend=backend)
+        # Ollama reports durations in nanoseconds
+        eval_duration = result.get("eval_duration")
+        if eval_duration:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / (eval_duration / 1e9), backend=backend)
+
+# ===============================================================================
+# PER-REQUEST TIMING
+# ===============================================================================
+# The middleware puts a RequestTiming into a context variable; the SQLAlchemy
+# cursor events (see database.py) add each query to it.
+
+class RequestTiming:
+    __slots__ = ("db_queries", "db_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+def record_db_query(statement: str, seconds: float):
+    DB_QUERY_SECONDS.observe(seconds, operation=statement.lstrip().split(" ", 1)[0].upper() or "OTHER")
+    timing = current_timing.get()
+    if timing is not None:
+        timing.db_queries += 1
+        timing.db_seconds += seconds
+
+_route_paths: Dict[object, str] = {}
+
+def _route_path(scope) -> str:
+    """Route template (e.g. /messages/{chat_id}) so labels don't explode per id"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        app = scope.get("app")
+        path = next((route.path for route in getattr(app, "routes", []) if getattr(route, "endpoint", None) is endpoint), "unmatched")
+        _route_paths[endpoint] = path
+    return path
+
+class MetricsMiddleware:
+    """ASGI middleware: latency per route, DB time per request, Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Handler work is done by now (except for streamed bodies)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                server_timing = 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+                    timing.db_seconds * 1000, timing.db_queries, elapsed_ms
+                )
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", server_timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
+            route_path = _route_path(scope)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route_path, status=status_code)
+            HTTP_REQUEST_DB_SECONDS.observe(timing.db_seconds, route=route_path)
+            HTTP_REQUEST_DB_QUERIES.observe(timing.db_queries, route=route_path)
@@ -0,0 +1,306 @@
+# ===============================================================================
+# CRUD AI CHAT APP - SCHEMA MIGRATIONS
+# ===============================================================================
+# Versioned, ordered schema changes tracked in the `schema_migrations` table
+# Replaces Base.metadata.create_all so existing databases get upgraded in place
+#
+# Adding a migration: append (version, description, function) to MIGRATIONS.
+# Each function receives a sync SQLAlchemy Connection inside one transaction
+# and must use explicit DDL (never the current models), so it keeps working
+# after the models change again.
+#
+# Run manually with: python migrations.py
+
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+# ===============================================================================
+# MIGRATIONS
+# ===============================================================================
+
+def _baseline(conn: Connection):
+    """Schema as created by the old create_all (users, chats, messages)"""
+    # Legacy databases already have it; fresh databases are built from the models.
+
+def _indexes_and_cascade(conn: Connection):
+    """Composite indexes for hot reads and ON DELETE CASCADE chats -> messages"""
+    if conn.dialect.name == "sqlite":
+        # SQLite can't alter a foreign key, so rebuild the messages table
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_old"))
+        conn.execute(text("""
+            CREATE TABLE messages (
+                id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                content VARCHAR NOT NULL,
+                is_from_user BOOLEAN NOT NULL,
+                created_at DATETIME NOT NULL,
+                PRIMARY KEY (id),
+                FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+            )
+        """))
+        # Orphaned messages (from deletes without cascade) are dropped
+        conn.execute(text("""
+            INSERT INTO messages (id, chat_id, content, is_from_user, created_at)
+            SELECT id, chat_id, content, is_from_user, created_at FROM messages_old
+            WHERE chat_id IN (SELECT id FROM chats)
+        """))
+        conn.execute(text("DROP TABLE messages_old"))
+    else:
+        conn.execute(text("DELETE FROM messages WHERE chat_id NOT IN (SELECT id FROM chats)"))
+        conn.execute(text("ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_chat_id_fkey"))
+        conn.execute(text(
+            "ALTER TABLE messages ADD CONSTRAINT messages_chat_id_fkey "
+            "FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE"
+        ))
+
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_chat_id_created_at ON messages (chat_id, created_at, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chats_user_id_updated_at ON chats (user_id, updated_at, id)"))
+
+def _chat_summaries(conn: Connection):
+    """Rolling conversation summary per chat for the token-budgeted context"""
+    conn.execute(text("ALTER TABLE chats ADD COLUMN summary TEXT"))
+    conn.execute(text("ALTER TABLE chats ADD COLUMN summary_message_id INTEGER"))
+
+def _message_idempotency_keys(conn: Connection):
+    """Client idempotency keys so retried message posts aren't stored twice"""
+    conn.execute(text("ALTER TABLE messages ADD COLUMN idempotency_key VARCHAR"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_messages_chat_id_idempotency_key "
+        "ON messages (chat_id, idempotency_key)"
+    ))
+
+def _search_index(conn: Connection):
+    """Full-text index over message content and chat titles (see search_service.py)"""
+    if conn.dialect.name == "sqlite":
+        # External-content FTS5 tables, kept in sync by triggers (cascade deletes fire them too)
+        for table, column in (("messages", "content"), ("chats", "title")):
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"{column}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column} ON {table} BEGIN
+                    INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                    INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+                END
+            """))
+            conn.execute(text(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')"))
+    else:
+        # Generated tsvector columns stay in sync without triggers; 'simple' = no
+        # language-specific stemming, chats mix German and English
+        for table, column in (("messages", "content"), ("chats", "title")):
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce({column}, ''))) STORED"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"))
+
+def _chat_aggregates(conn: Connection):
+    """Denormalized sidebar fields on chats: last activity, count, preview, last AI message"""
+    conn.execute(text("ALTER TABLE chats ADD COLUMN last_activity_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00'"))
+    conn.execute(text("ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text("ALTER TABLE chats ADD COLUMN last_message_preview VARCHAR"))
+    conn.execute(text("ALTER TABLE chats ADD COLUMN last_ai_message_id INTEGER"))
+    conn.execute(text("""
+        UPDATE chats SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.chat_id = chats.id),
+            last_activity_at = COALESCE((SELECT MAX(m.created_at) FROM messages m WHERE m.chat_id = chats.id), chats.updated_at),
+            last_message_preview = (
+                SELECT substr(m.content, 1, 120) FROM messages m WHERE m.chat_id = chats.id
+                ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+            ),
+            last_ai_message_id = (SELECT MAX(m.id) FROM messages m WHERE m.chat_id = chats.id AND NOT m.is_from_user)
+    """))
+    conn.execute(text("DROP INDEX IF EXISTS ix_chats_user_id_updated_at"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chats_user_id_last_activity_at ON chats (user_id, last_activity_at, id)"))
+
+def _generation_jobs(conn: Connection):
+    """Durable AI generation jobs (queued/running/finished) with worker leases"""
+    id_column = "id INTEGER NOT NULL PRIMARY KEY" if conn.dialect.name == "sqlite" else "id SERIAL PRIMARY KEY"
+    conn.execute(text(f"""
+        CREATE TABLE generation_jobs (
+            {id_column},
+            chat_id INTEGER NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            trigger_message_id INTEGER NOT NULL,
+            status VARCHAR NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result_message_id INTEGER,
+            error VARCHAR,
+            lease_token VARCHAR,
+            lease_expires_at TIMESTAMP,
+            available_at TIMESTAMP,
+            created_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX ux_generation_jobs_chat_id_trigger_message_id "
+        "ON generation_jobs (chat_id, trigger_message_id)"
+    ))
+    conn.execute(text("CREATE INDEX ix_generation_jobs_status_id ON generation_jobs (status, id)"))
+
+def _search_index_by_owner(conn: Connection):
+    """Full-text index keyed by owner too, so a search only ranks the caller's rows"""
+    if conn.dialect.name == "sqlite":
+        # Rebuilt with an "owner" token column ('u<user_id>') matched alongside the
+        # text, read through views since messages don't carry user_id themselves
+        for table in ("messages", "chats"):
+            for action in ("insert", "delete", "update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_fts_{action}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}_fts"))
+        conn.execute(text("""
+            CREATE VIEW messages_search_source AS
+            SELECT m.id AS id, m.content AS body, 'u' || c.user_id AS owner
+            FROM messages m JOIN chats c ON c.id = m.chat_id
+        """))
+        conn.execute(text("CREATE VIEW chats_search_source AS SELECT id, title AS body, 'u' || user_id AS owner FROM chats"))
+        for table in ("messages", "chats"):
+            # Prefix index for 2-3 characters: short search-as-you-type prefixes
+            # would otherwise merge the doclists of hundreds of terms per query
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5("
+                f"body, owner, content='{table}_search_source', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            # The owner column only filters: it must not affect the ranking
+            conn.execute(text(f"INSERT INTO {table}_fts ({table}_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"))
+
+        owner_of = "(SELECT 'u' || user_id FROM chats WHERE id = {row}.chat_id)"
+        conn.execute(text(f"""
+            CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, body, owner) VALUES (new.id, new.content, {owner_of.format(row="new")});
+            END
+        """))
+        # Deleted together with their chat: the chat is already gone here, so the
+        # chat's BEFORE DELETE trigger below has removed them from the index
+        conn.execute(text(f"""
+            CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages
+            WHEN EXISTS (SELECT 1 FROM chats WHERE id = old.chat_id) BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, body, owner) VALUES ('delete', old.id, old.content, {owner_of.format(row="old")});
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, body, owner) VALUES ('delete', old.id, old.content, {owner_of.format(row="old")});
+                INSERT INTO messages_fts (rowid, body, owner) VALUES (new.id, new.content, {owner_of.format(row="new")});
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER chats_fts_delete_messages BEFORE DELETE ON chats BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, body, owner)
+                SELECT 'delete', m.id, m.content, 'u' || old.user_id FROM messages m WHERE m.chat_id = old.id;
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER chats_fts_insert AFTER INSERT ON chats BEGIN
+                INSERT INTO chats_fts (rowid, body, owner) VALUES (new.id, new.title, 'u' || new.user_id);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER chats_fts_delete AFTER DELETE ON chats BEGIN
+                INSERT INTO chats_fts (chats_fts, rowid, body, owner) VALUES ('delete', old.id, old.title, 'u' || old.user_id);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER chats_fts_update AFTER UPDATE OF title ON chats BEGIN
+                INSERT INTO chats_fts (chats_fts, rowid, body, owner) VALUES ('delete', old.id, old.title, 'u' || old.user_id);
+                INSERT INTO chats_fts (rowid, body, owner) VALUES (new.id, new.title, 'u' || new.user_id);
+            END
+        """))
+        for table in ("messages", "chats"):
+            conn.execute(text(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')"))
+    else:
+        # Composite GIN (btree_gin): the owner condition and the text match are
+        # intersected inside one index scan instead of after ranking every match
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_chat_id_search_vector ON messages USING GIN (chat_id, search_vector)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chats_user_id_search_vector ON chats USING GIN (user_id, search_vector)"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_search_vector"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_chats_search_vector"))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline schema", _baseline),
+    (2, "composite indexes and ON DELETE CASCADE for messages", _indexes_and_cascade),
+    (3, "chat summaries", _chat_summaries),
+    (4, "message idempotency keys", _message_idempotency_keys),
+    (5, "full-text search index", _search_index),
+    (6, "chat sidebar aggregates", _chat_aggregates),
+    (7, "generation jobs", _generation_jobs),
+    (8, "owner-scoped full-text search index", _search_index_by_owner),
+]
+
+# ===============================================================================
+# MIGRATION RUNNER
+# ===============================================================================
+
+def _stamp(conn: Connection, version: int, description: str):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+        {"v": version, "d": description, "t": datetime.utcnow()}
+    )
+
+def upgrade(conn: Connection):
+    """Bring the database schema up to the latest migration"""
+    existing_tables = set(inspect(conn).get_table_names())
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    current = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+
+    if current == 0:
+        if "users" not in existing_tables:
+            # Fresh database: create the current schema and mark everything applied
+            Base.metadata.create_all(conn)
+            # Not expressible in the models (FTS tables / generated columns)
+            _search_index(conn)
+            _search_index_by_owner(conn)
+            for version, description, _ in MIGRATIONS:
+                _stamp(conn, version, description)
+            logger.info("Datenbank erstellt - Schema-Version %s", MIGRATIONS[-1][0])
+            return
+        # Database created by the old create_all: baseline is already there
+        _stamp(conn, 1, MIGRATIONS[0][1])
+        current = 1
+
+    for version, description, migrate in MIGRATIONS:
+        if version > current:
+            logger.info("Migration %s: %s", version, description)
+            migrate(conn)
+            _stamp(conn, version, description)
+
+async def run_migrations(engine):
+    """Apply pending migrations in a single transaction"""
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade)
+
+if __name__ == "__main__":
+    import asyncio
+    from database import engine, close_db
+    from logging_config import setup_logging
+
+    setup_logging()
+
+    async def _main():
+        await run_migrations(engine)
+        await close_db()
+
+    asyncio.run(_main())
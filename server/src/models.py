@@ -4,7 +4,7 @@
 # SQLAlchemy ORM models for Users, Chats, and Messages
 # Defines database schema and relationships between entities
 
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -35,12 +35,19 @@ class User(Base):
 # Represents individual messages in chats (both user and AI messages)
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # History reads: WHERE chat_id = ? ORDER BY created_at, id
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id"),
+        # Retried POST /messages with the same Idempotency-Key stores one message
+        Index("ux_messages_chat_id_idempotency_key", "chat_id", "idempotency_key", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
     content = Column(String, nullable=False)
     is_from_user = Column(Boolean, nullable=False)  # True = User, False = AI
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    idempotency_key = Column(String, nullable=True)  # Client-supplied, unique per chat
 
 # ===============================================================================
 # CHAT MODEL
@@ -48,8 +55,46 @@ class Message(Base):
 # Represents chat conversations that contain multiple messages
 class Chat(Base):
     __tablename__ = "chats"  
+    __table_args__ = (
+        # Sidebar reads: WHERE user_id = ? ORDER BY last_activity_at DESC
+        Index("ix_chats_user_id_last_activity_at", "user_id", "last_activity_at", "id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
+    summary = Column(Text, nullable=True)  # Rolling AI summary of older turns
+    summary_message_id = Column(Integer, nullable=True)  # Last message folded into summary
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Sidebar aggregates, maintained in the same transaction as every message insert
+    last_activity_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Newest message (or creation)
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_preview = Column(String, nullable=True)  # Start of the newest message
+    last_ai_message_id = Column(Integer, nullable=True)
+
+# ===============================================================================
+# GENERATION JOB MODEL
+# ===============================================================================
+# Durable AI generation request, run by the job workers (see job_service.py)
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        # One job per chat state: re-submitting returns (or restarts) the same job
+        Index("ux_generation_jobs_chat_id_trigger_message_id", "chat_id", "trigger_message_id", unique=True),
+        # Workers: WHERE status IN (...) ORDER BY id
+        Index("ix_generation_jobs_status_id", "status", "id"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    trigger_message_id = Column(Integer, nullable=False)  # Newest message when the job was submitted
+    status = Column(String, nullable=False)  # queued | running | succeeded | failed | cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    result_message_id = Column(Integer, nullable=True)  # The saved AI message
+    error = Column(String, nullable=True)
+    lease_token = Column(String, nullable=True)  # Set by the worker running it
+    lease_expires_at = Column(DateTime, nullable=True)  # Reclaimed by another worker after this
+    available_at = Column(DateTime, nullable=True)  # Queued for a retry: not claimed before this
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
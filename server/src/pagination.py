@@ -0,0 +1,83 @@
+# ===============================================================================
+# CRUD AI CHAT APP - KEYSET PAGINATION
+# ===============================================================================
+# Opaque before/after cursors over (timestamp, id) for bounded list queries
+# Cursors are returned to the client in X-Before-Cursor / X-After-Cursor headers
+
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+
+BEFORE_CURSOR_HEADER = "X-Before-Cursor"
+AFTER_CURSOR_HEADER = "X-After-Cursor"
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Encode a (timestamp, id) position as an opaque URL-safe cursor"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor created by encode_cursor (400 if malformed)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(
+    query: Select,
+    time_column: Any,
+    id_column: Any,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Tuple[Select, bool]:
+    """
+    Restrict query to one page around a cursor.
+    Without a cursor (or with `before`) the page holds the newest rows older
+    than the cursor; with `after` the oldest rows newer than it. Returns the
+    query (limit + 1 rows, to detect more) and whether it reads forward in time.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
+    position = tuple_(time_column, id_column)
+    if after:
+        query = query.where(position > tuple_(*decode_cursor(after)))
+        return query.order_by(time_column.asc(), id_column.asc()).limit(limit + 1), True
+    if before:
+        query = query.where(position < tuple_(*decode_cursor(before)))
+    return query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1), False
+
+def finish_page(
+    rows: Sequence[Any],
+    limit: int,
+    forward: bool,
+    response: Response,
+    time_attr: str,
+    newest_first: bool,
+    had_cursor: bool,
+) -> List[Any]:
+    """
+    Trim the extra probe row, set cursor headers and order rows for output.
+    X-Before-Cursor is set when older rows exist, X-After-Cursor when a
+    page was requested from a cursor and newer rows may follow.
+    """
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Rows arrive oldest-first when reading forward, newest-first otherwise
+    oldest_first = rows if forward else rows[::-1]
+    if oldest_first:
+        oldest, newest = oldest_first[0], oldest_first[-1]
+        if (has_more and not forward) or (forward and had_cursor):
+            response.headers[BEFORE_CURSOR_HEADER] = encode_cursor(getattr(oldest, time_attr), oldest.id)
+        if (has_more and forward) or (not forward and had_cursor):
+            response.headers[AFTER_CURSOR_HEADER] = encode_cursor(getattr(newest, time_attr), newest.id)
+
+    return oldest_first[::-1] if newest_first else oldest_first
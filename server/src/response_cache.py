@@ -0,0 +1,169 @@
+# ===============================================================================
+# CRUD AI CHAT APP - AI RESPONSE CACHE
+# ===============================================================================
+# Opt-in cache of complete AI answers for identical generation requests
+# Keyed by model, normalized conversation context and generation options
+#
+# AI_RESPONSE_CACHE=off (default) | memory | sqlite
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# ===============================================================================
+# CACHE KEY
+# ===============================================================================
+# Whitespace differences (trailing newlines, double spaces) don't change the key
+
+_WHITESPACE = re.compile(r"\s+")
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Hash the generation-relevant parts of an Ollama chat payload"""
+    canonical = {
+        "model": payload.get("model"),
+        "messages": [
+            {"role": message["role"], "content": _normalize(message["content"])}
+            for message in payload.get("messages", [])
+        ],
+        "options": payload.get("options") or {},
+    }
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+# ===============================================================================
+# IN-MEMORY BACKEND
+# ===============================================================================
+# Per-worker LRU with TTL
+
+class InMemoryResponseCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or time.time() >= entry[1]:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def set(self, key: str, response: str):
+        self._entries[key] = (response, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+# ===============================================================================
+# SQLITE BACKEND
+# ===============================================================================
+# On-disk cache shared by all workers on a host and kept across restarts.
+# sqlite3 is blocking, so every call runs in a worker thread; they share one
+# connection (opened once, WAL set once) behind a lock.
+
+# Sets between eviction passes: the table may run this far over max_entries
+EVICT_EVERY = 100
+
+class SQLiteResponseCache:
+    def __init__(self, path: str = "./ai_cache.db", max_entries: int = 10000, ttl: float = 3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_response_cache_last_used ON ai_response_cache (last_used)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_response_cache_expires_at ON ai_response_cache (expires_at)")
+        with self._lock:
+            self._evict(time.time())
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response FROM ai_response_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE ai_response_cache SET last_used = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def _set(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ai_response_cache (key, response, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, response, now + self.ttl, now)
+                )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired rows, then least recently used beyond the size limit (caller holds the lock)"""
+        with self._conn:
+            self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM ai_response_cache WHERE key IN ("
+                    "SELECT key FROM ai_response_cache ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    async def get(self, key: str) -> Optional[str]:
+        response = await asyncio.to_thread(self._get, key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, key: str, response: str):
+        await asyncio.to_thread(self._set, key, response)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "sqlite", "path": self.path, "hits": self.hits, "misses": self.misses}
+
+# ===============================================================================
+# FACTORY / GLOBAL INSTANCE
+# ===============================================================================
+
+def create_response_cache():
+    """Build the configured cache backend, or None when caching is off"""
+    backend = os.getenv("AI_RESPONSE_CACHE", "off").lower()
+    ttl = float(os.getenv("AI_RESPONSE_CACHE_TTL", "3600"))
+    size = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "1000"))
+    if backend == "memory":
+        return InMemoryResponseCache(max_entries=size, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteResponseCache(path=os.getenv("AI_RESPONSE_CACHE_PATH", "./ai_cache.db"), max_entries=size, ttl=ttl)
+    return None
+
+response_cache = create_response_cache()
@@ -4,13 +4,35 @@
 # FastAPI router with all endpoints for Users, Chats, Messages, and AI
 # Now includes Auth0 authentication and user management
 
-from fastapi import APIRouter, HTTPException, Depends
-from database import SessionLocal
-from models import Chat, User, Message
-from schemas import ChatCreate, ChatResponse, UserCreate, UserResponse, MessageCreate, MessageResponse, UserUpdate, ChatUpdate
-from ai_service import ollama_service
-from auth_service import get_current_user, get_current_user_optional
-from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, SessionLocal
+from models import Chat, User, Message, GenerationJob
+from schemas import ChatCreate, ChatResponse, UserResponse, MessageCreate, MessageResponse, UserUpdate, ChatUpdate, TurnCreate, TurnResponse, MessageImport, MessageImportResult, SearchResult, JobResponse
+from ai_service import ollama_service, generation_limiter, GenerationRejected
+from auth_service import auth_service, get_current_user, get_current_user_optional
+from context_service import ChatContext, build_chat_context, schedule_summary_update
+from events_service import event_hub
+from job_service import job_runner, JobFailed, JobRetry, SUCCEEDED, CANCELLED, FINISHED_STATUSES
+from response_cache import response_cache
+from pagination import keyset_page, finish_page
+from http_cache import make_etag, is_not_modified, not_modified_response, cache_headers, json_list_response
+from search_service import search_user_history
+from user_service import UserIdentity, get_current_identity, invalidate_identity
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
 
 # ===============================================================================
 # ROUTER INITIALIZATION
@@ -24,185 +46,160 @@ router = APIRouter()
 # User management with Auth0 authentication
 
 @router.get("/users/me", response_model=UserResponse)
-async def get_current_user_profile(current_user: dict = Depends(get_current_user)):
-    """Get the current authenticated user's profile"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            # Auto-create user if they don't exist but are authenticated
-            user_data = UserCreate(
-                auth0_user_id=auth0_user_id,
-                username=current_user.get("nickname") or current_user.get("email", "user").split("@")[0],
-                email=current_user.get("email", ""),
-                name=current_user.get("name") or current_user.get("nickname") or current_user.get("email", "user").split("@")[0],
-                picture=current_user.get("picture") or ""
-            )
-            user = await create_user_internal(user_data, db)
-        
-        return user
-    finally:
-        db.close()
+async def get_current_user_profile(identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Get the current authenticated user's profile (auto-created on first login)"""
+    user = await db.get(User, identity.id)
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return user
 
 @router.put("/users/me", response_model=UserResponse)
 async def update_current_user_profile(
     user_update: UserUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
 ):
     """Update the current authenticated user's profile"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Update only provided fields
-        if user_update.username is not None:
-            user.username = user_update.username
-        if user_update.name is not None:
-            user.name = user_update.name
-        if user_update.picture is not None:
-            user.picture = user_update.picture
-            
-        db.commit()
-        db.refresh(user)
-        return user
-    finally:
-        db.close()
-
-async def create_user_internal(user_data: UserCreate, db) -> User:
-    """Internal helper to create user"""
-    db_user = User(
-        auth0_user_id=user_data.auth0_user_id,
-        username=user_data.username,
-        email=user_data.email,
-        name=user_data.name,
-        picture=user_data.picture
-    )
+    user = await db.get(User, identity.id)
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    # Update only provided fields
+    if user_update.username is not None:
+        user.username = user_update.username
+    if user_update.name is not None:
+        user.name = user_update.name
+    if user_update.picture is not None:
+        user.picture = user_update.picture
+        
+    await db.commit()
+    await db.refresh(user)
+    
+    # Cached identity carries username/name, so drop it
+    await invalidate_identity(current_user.get("sub"))
+    return user
+
+async def get_owned_chat(db: AsyncSession, chat_id: int, user_id: int) -> Chat:
+    """Internal helper to load a chat owned by the user or raise 404"""
+    chat = (await db.execute(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))).scalar_one_or_none()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return chat
+
+# ===============================================================================
+# CHAT AGGREGATES
+# ===============================================================================
+# Chat.last_activity_at, message_count, last_message_preview and last_ai_message_id
+# let GET /chats render the whole sidebar from one indexed query. Every message
+# insert updates them in the same transaction. Single-message updates keep
+# updated_at untouched; a bulk import bumps it (see GET /messages Last-Modified).
+
+CHAT_PREVIEW_CHARS = 120
+
+def chat_activity_update(message: Message):
+    """UPDATE folding one newly inserted (flushed) message into its chat's aggregates"""
+    values = dict(
+        message_count=Chat.message_count + 1,
+        last_activity_at=message.created_at,
+        last_message_preview=message.content[:CHAT_PREVIEW_CHARS],
+        updated_at=Chat.updated_at,
+    )
+    if not message.is_from_user:
+        values["last_ai_message_id"] = message.id
+    return update(Chat).where(Chat.id == message.chat_id).values(**values)
+
+def chat_aggregates_refresh(chat_id: int):
+    """UPDATE recomputing a chat's aggregates from its messages (after bulk inserts)"""
+    in_chat = Message.chat_id == chat_id
+    return update(Chat).where(Chat.id == chat_id).values(
+        message_count=select(func.count(Message.id)).where(in_chat).scalar_subquery(),
+        last_activity_at=func.coalesce(select(func.max(Message.created_at)).where(in_chat).scalar_subquery(), Chat.last_activity_at),
+        last_message_preview=(
+            select(func.substr(Message.content, 1, CHAT_PREVIEW_CHARS)).where(in_chat)
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(1).scalar_subquery()
+        ),
+        last_ai_message_id=select(func.max(Message.id)).where(in_chat, Message.is_from_user.is_(False)).scalar_subquery(),
+    )
 
 # ===============================================================================
 # CHAT ENDPOINTS WITH AUTH0
 # ===============================================================================
 # Chat management with user authentication
 
+# Columns of ChatResponse / MessageResponse, selected as plain rows for the list endpoints
+CHAT_LIST_COLUMNS = [getattr(Chat, field) for field in ChatResponse.model_fields]
+MESSAGE_LIST_COLUMNS = [getattr(Message, field) for field in MessageResponse.model_fields]
+
 @router.get("/chats", response_model=List[ChatResponse])
-async def get_user_chats(current_user: dict = Depends(get_current_user)):
-    """Get all chats for the authenticated user"""
-    db = SessionLocal()
-    try:
-        # Get user from database
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        chats = db.query(Chat).filter(Chat.user_id == user.id).order_by(Chat.updated_at.desc()).all()
-        return chats
-    finally:
-        db.close()
+async def get_user_chats(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the authenticated user's chats, most recently active first (keyset paginated, ETag)"""
+    # Any create, rename, delete or new message changes one of these. No
+    # Last-Modified: a deletion doesn't move any timestamp forward.
+    version = (await db.execute(
+        select(func.count(Chat.id), func.max(Chat.id), func.max(Chat.last_activity_at), func.max(Chat.updated_at))
+        .where(Chat.user_id == identity.id)
+    )).one()
+    etag = make_etag("chats", identity.id, *version, request.url.query)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    
+    query, forward = keyset_page(
+        select(*CHAT_LIST_COLUMNS).where(Chat.user_id == identity.id),
+        Chat.last_activity_at, Chat.id, limit, before=before, after=after
+    )
+    chats = (await db.execute(query)).all()
+    page = finish_page(chats, limit, forward, response, "last_activity_at", newest_first=True, had_cursor=bool(before or after))
+    return json_list_response(page, response, cache_headers(etag))
 
 @router.get("/chats/{chat_id}", response_model=ChatResponse)
-async def get_chat(chat_id: int, current_user: dict = Depends(get_current_user)):
+async def get_chat(chat_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
     """Get a specific chat (only if owned by user)"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-            
-        return chat
-    finally:
-        db.close()
+    return await get_owned_chat(db, chat_id, identity.id)
 
 @router.post("/chats", response_model=ChatResponse)
-async def create_chat(chat: ChatCreate, current_user: dict = Depends(get_current_user)):
+async def create_chat(chat: ChatCreate, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
     """Create a new chat for the authenticated user"""
-    db = SessionLocal()
-    try:
-        # Get user from database
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            # Auto-create user if they don't exist
-            user_data = UserCreate(
-                auth0_user_id=auth0_user_id,
-                username=current_user.get("nickname", current_user.get("email", "user")),
-                email=current_user.get("email", ""),
-                name=current_user.get("name"),
-                picture=current_user.get("picture")
-            )
-            user = await create_user_internal(user_data, db)
-        
-        db_chat = Chat(title=chat.title, user_id=user.id)
-        
-        db.add(db_chat)
-        db.commit()
-        db.refresh(db_chat)
-        return db_chat
-    finally:
-        db.close()
+    db_chat = Chat(title=chat.title, user_id=identity.id)
+    
+    db.add(db_chat)
+    await db.commit()
+    await db.refresh(db_chat)
+    await event_hub.publish(identity.id, "chat.created", chat=ChatResponse.model_validate(db_chat).model_dump(mode="json"))
+    return db_chat
 
 @router.put("/chats/{chat_id}", response_model=ChatResponse)
-async def update_chat(chat_id: int, chat_update: ChatUpdate, current_user: dict = Depends(get_current_user)):
+async def update_chat(chat_id: int, chat_update: ChatUpdate, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
     """Update a chat (only if owned by user)"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    db_chat = await get_owned_chat(db, chat_id, identity.id)
         
-        db_chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
-        if not db_chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-            
-        db_chat.title = chat_update.title
-        db.commit()
-        db.refresh(db_chat)
-        return db_chat
-    finally:
-        db.close()
+    db_chat.title = chat_update.title
+    await db.commit()
+    await db.refresh(db_chat)
+    await event_hub.publish(identity.id, "chat.updated", chat=ChatResponse.model_validate(db_chat).model_dump(mode="json"))
+    return db_chat
 
 @router.delete("/chats/{chat_id}")
-async def delete_chat(chat_id: int, current_user: dict = Depends(get_current_user)):
+async def delete_chat(chat_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
     """Delete a chat and all its messages (only if owned by user)"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
+    db_chat = await get_owned_chat(db, chat_id, identity.id)
         
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        db_chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
-        if not db_chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-            
-        # Delete all messages in this chat first
-        db.query(Message).filter(Message.chat_id == chat_id).delete()
-        db.delete(db_chat)
-        db.commit()
-        return {"ok": True}
-    finally:
-        db.close()
+    # Messages are removed by ON DELETE CASCADE
+    await db.delete(db_chat)
+    await db.commit()
+    await event_hub.publish(identity.id, "chat.deleted", chat_id=chat_id)
+    return {"ok": True}
 
 # ===============================================================================
 # MESSAGE ENDPOINTS WITH AUTH0
@@ -210,130 +207,813 @@ async def delete_chat(chat_id: int, current_user: dict = Depends(get_current_use
 # Message management with user authentication
 
 @router.get('/messages/{chat_id}', response_model=List[MessageResponse])
-async def get_messages(chat_id: int, current_user: dict = Depends(get_current_user)):
-    """Get all messages for a specific chat (only if user owns the chat)"""
-    db = SessionLocal()
-    try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if user owns the chat
-        chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-            
-        messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at.asc()).all()
-        return messages
-    finally:
-        db.close()
+async def get_messages(
+    chat_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get messages for a chat, oldest first; latest `limit` by default (only if user owns the chat, ETag)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    # Messages are append-only, so the chat aggregates identify the history state
+    # without touching the messages table; bulk imports also bump updated_at
+    etag = make_etag("messages", chat.id, chat.message_count, chat.last_ai_message_id, chat.last_activity_at, request.url.query)
+    last_modified = max(chat.last_activity_at, chat.updated_at)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    query, forward = keyset_page(
+        select(*MESSAGE_LIST_COLUMNS).where(Message.chat_id == chat_id),
+        Message.created_at, Message.id, limit, before=before, after=after
+    )
+    messages = (await db.execute(query)).all()
+    page = finish_page(messages, limit, forward, response, "created_at", newest_first=False, had_cursor=bool(before or after))
+    return json_list_response(page, response, cache_headers(etag, last_modified))
 
 @router.post('/messages', response_model=MessageResponse)
-async def create_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
+async def create_message(
+    message: MessageCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
     """Create a new message in a chat (only if user owns the chat)"""
-    db = SessionLocal()
+    # Check if user owns the chat
+    await get_owned_chat(db, message.chat_id, identity.id)
+    
+    db_message, _ = await store_message(db, identity.id, message.chat_id, message.content, message.is_from_user, idempotency_key)
+    return db_message
+
+async def store_message(db: AsyncSession, user_id: int, chat_id: int, content: str, is_from_user: bool, idempotency_key: Optional[str]) -> Tuple[Message, bool]:
+    """Internal helper to insert a message; returns (message, created), honouring the idempotency key"""
+    # Retry of a request that already went through: return the stored message
+    if idempotency_key:
+        existing = await find_idempotent_message(db, chat_id, idempotency_key)
+        if existing:
+            return existing, False
+    
+    db_message = Message(
+        chat_id=chat_id,
+        content=content,
+        is_from_user=is_from_user,
+        idempotency_key=idempotency_key
+    )
+    
+    db.add(db_message)
     try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if user owns the chat
-        chat = db.query(Chat).filter(Chat.id == message.chat_id, Chat.user_id == user.id).first()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-            
-        db_message = Message(
-            chat_id=message.chat_id,
-            content=message.content,
-            is_from_user=message.is_from_user
-        )
-        
-        db.add(db_message)
-        db.commit()
-        db.refresh(db_message)
-        return db_message
-    finally:
-        db.close()
+        await db.flush()
+        await db.execute(chat_activity_update(db_message))
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key won the insert
+        await db.rollback()
+        existing = await find_idempotent_message(db, chat_id, idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing, False
+    await db.refresh(db_message)
+    await publish_message(user_id, db_message)
+    return db_message, True
+
+async def publish_message(user_id: int, message: Message):
+    """Internal helper to push a stored message to the user's live connections"""
+    await event_hub.publish(user_id, "message.created", message=MessageResponse.model_validate(message).model_dump(mode="json"))
+
+async def find_idempotent_message(db: AsyncSession, chat_id: int, idempotency_key: str) -> Optional[Message]:
+    """Internal helper to look up a message by its client idempotency key"""
+    result = await db.execute(
+        select(Message).where(Message.chat_id == chat_id, Message.idempotency_key == idempotency_key)
+    )
+    return result.scalar_one_or_none()
+
+# ===============================================================================
+# SEARCH ENDPOINT
+# ===============================================================================
+# Full-text search over the user's messages and chat titles (see search_service.py)
+
+@router.get('/search', response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Search the authenticated user's chat history, best matches first (offset paginated)"""
+    return await search_user_history(db, identity.id, q, limit, offset)
 
 # ===============================================================================
 # AI ENDPOINTS WITH AUTH0
 # ===============================================================================
 # AI response generation with user authentication
 
-@router.post('/ai/generate/{chat_id}', response_model=MessageResponse)
-async def generate_ai_response(chat_id: int, current_user: dict = Depends(get_current_user)):
-    """Generate AI response for the latest message in a chat (only if user owns the chat)"""
-    db = SessionLocal()
+async def build_ai_context(db: AsyncSession, chat: Chat, identity: UserIdentity, up_to_message_id: Optional[int] = None) -> ChatContext:
+    """Internal helper to build the token-budgeted model context for a chat"""
+    # Stable per user (no history inside), so Ollama can reuse the cached prefix
+    username = identity.name or identity.username or "User"
+    system_prompt = f"""Du bist ein hilfreicher AI-Assistent für {username}.
+Antworte auf Deutsch und sei freundlich und hilfreich."""
+    
+    return await build_chat_context(db, chat, system_prompt, up_to_message_id)
+
+async def admit_generation(user_id: int) -> float:
+    """Internal helper to wait for a generation slot, mapping rejections to 429/503"""
     try:
-        auth0_user_id = current_user.get("sub")
-        user = db.query(User).filter(User.auth0_user_id == auth0_user_id).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if user owns the chat
-        chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
-        
-        # Load recent messages for conversation context
-        recent_messages = db.query(Message).filter(
-            Message.chat_id == chat_id
-        ).order_by(Message.created_at.desc()).limit(10).all()
-        
-        if not recent_messages:
-            raise HTTPException(status_code=400, detail="No messages to respond to")
-        
-        # Check if Ollama AI service is available
-        if not await ollama_service.is_available():
-            raise HTTPException(status_code=503, detail="AI service unavailable. Make sure Ollama is running.")
-        
-        # Build conversation context from recent messages
-        context = []
-        for msg in reversed(recent_messages):  # Oldest first for proper context
-            role = "user" if msg.is_from_user else "assistant"
-            context.append(f"{role}: {msg.content}")
-        
-        conversation_context = "\n".join(context)
-        
-        # Find the latest user message to respond to
-        last_user_message = next((msg for msg in recent_messages if msg.is_from_user), None)
-        if not last_user_message:
-            raise HTTPException(status_code=400, detail="No user message found")
-        
-        # Generate AI response using conversation context
-        username = user.name or user.username or "User"
-        system_prompt = f"""Du bist ein hilfreicher AI-Assistent für {username}. 
-Antworte auf Deutsch und sei freundlich und hilfreich. 
-Hier ist der bisherige Gesprächsverlauf:
-{conversation_context}
-
-Antworte nun auf die letzte Nachricht des Nutzers."""
-        
-        ai_response = await ollama_service.generate_response(
-            prompt=last_user_message.content,
-            system_prompt=system_prompt
-        )
+        return await generation_limiter.acquire(user_id)
+    except GenerationRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def save_ai_message(chat_id: int, user_id: int, content: str) -> Message:
+    """Persist an AI message in its own session (outlives the request session)"""
+    async with SessionLocal() as session:
+        ai_message = Message(chat_id=chat_id, content=content, is_from_user=False)
+        session.add(ai_message)
+        await session.flush()
+        await session.execute(chat_activity_update(ai_message))
+        await session.commit()
+        await session.refresh(ai_message)
+    await publish_message(user_id, ai_message)
+    return ai_message
+
+# ===============================================================================
+# SINGLE-FLIGHT GENERATION
+# ===============================================================================
+# Double-clicks and retries for the same chat state share one generation:
+# keyed on (chat_id, id of the newest message), later callers await the
+# first caller's future and get the same saved AI message back.
+
+_inflight_generations: Dict[Tuple[int, int], asyncio.Future] = {}
+_flight_saves: Set[asyncio.Task] = set()  # Strong references until each save is done
+
+def settle_flight(key: Tuple[int, int], future: asyncio.Future, message: Optional[Message] = None, error: Optional[BaseException] = None):
+    """Resolve a flight for everyone waiting on it and forget the key"""
+    if _inflight_generations.get(key) is future:
+        del _inflight_generations[key]
+    if future.done():
+        return
+    if message is not None:
+        future.set_result(message)
+    else:
+        future.set_exception(error or HTTPException(status_code=500, detail="Failed to generate AI response"))
+        future.exception()  # Mark retrieved: there may be no other waiters
+
+def save_for_flight(chat_id: int, user_id: int, content: str, flight: Tuple[Tuple[int, int], asyncio.Future]) -> asyncio.Task:
+    """Save an AI message as its own task and settle the flight once it's stored"""
+    # Settled from the done callback: waiters get the message even if the caller
+    # that started the save is cancelled while awaiting it
+    save = asyncio.ensure_future(save_ai_message(chat_id, user_id, content))
+    _flight_saves.add(save)
+    
+    def settle(done: asyncio.Task):
+        _flight_saves.discard(done)
+        settle_flight(*flight, message=None if done.cancelled() or done.exception() else done.result())
+    
+    save.add_done_callback(settle)
+    return save
+
+async def generate_and_save(chat_id: int, user_id: int, context: ChatContext, cache_key: Optional[str]) -> Message:
+    """Run one generation (cached, or queued through the limiter) and persist the answer"""
+    ai_response = await response_cache.get(cache_key) if cache_key else None
+    
+    if ai_response is None:
+        # Generate AI response using conversation context (bounded concurrency)
+        ticket = await admit_generation(user_id)
+        try:
+            ai_response = await ollama_service.generate_response(
+                messages=context.messages,
+                system_prompt=context.system_prompt
+            )
+        finally:
+            generation_limiter.release(ticket)
         
         if not ai_response:
             raise HTTPException(status_code=500, detail="Failed to generate AI response")
         
-        # Save AI response to database
-        ai_message = Message(
-            chat_id=chat_id,
-            content=ai_response,
-            is_from_user=False  # This is an AI message
+        if cache_key:
+            await response_cache.set(cache_key, ai_response)
+    
+    # Save AI response to database
+    ai_message = await save_ai_message(chat_id, user_id, ai_response)
+    
+    # Older turns no longer fit the budget: fold them into the chat summary
+    if context.needs_summary:
+        schedule_summary_update(chat_id, user_id)
+    
+    return ai_message
+
+@router.post('/ai/generate/{chat_id}', response_model=MessageResponse)
+async def generate_ai_response(chat_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Generate AI response for the latest message in a chat (only if user owns the chat)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    context = await build_ai_context(db, chat, identity)
+    
+    # Don't hold a pooled DB connection while queued or generating
+    await db.close()
+    
+    return await run_generation(chat_id, identity.id, context)
+
+async def run_generation(chat_id: int, user_id: int, context: ChatContext) -> Message:
+    """Internal helper to answer a chat state once, sharing in-flight work with duplicate callers"""
+    # Same chat state already being answered: share that result
+    key = (chat_id, context.last_message_id)
+    inflight = _inflight_generations.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+    
+    # Fail fast if Ollama is known to be down (cached health, no HTTP call)
+    if not ollama_service.is_available():
+        raise HTTPException(status_code=503, detail="AI service unavailable. Make sure Ollama is running.")
+    
+    # Identical request answered before? (opt-in, see response_cache.py)
+    cache_key = ollama_service.cache_key(context.messages, context.system_prompt) if response_cache else None
+    
+    # Runs as its own task so it finishes (and is saved once) even if this client disconnects
+    task = asyncio.ensure_future(generate_and_save(chat_id, user_id, context, cache_key))
+    _inflight_generations[key] = task
+    task.add_done_callback(lambda done: _inflight_generations.pop(key, None) if _inflight_generations.get(key) is done else None)
+    return await asyncio.shield(task)
+
+# ===============================================================================
+# STREAMING AI ENDPOINT (SERVER-SENT EVENTS)
+# ===============================================================================
+# Relays Ollama tokens as they arrive. Events:
+#   token -> {"content": "..."}             one per streamed chunk
+#   done  -> MessageResponse + timing info  after the AI message was saved
+#   error -> {"detail": "..."}              generation failed
+# If the client disconnects mid-stream, the partial answer is still saved.
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def replay_message_stream(message_source: Awaitable[Message], **done_extra) -> AsyncIterator[str]:
+    """Serve an already available answer (cached or shared) through the same SSE protocol"""
+    started = time.perf_counter()
+    try:
+        ai_message = await message_source
+    except HTTPException as e:
+        yield sse_event("error", {"detail": e.detail})
+        return
+    yield sse_event("token", {"content": ai_message.content})
+    done = MessageResponse.model_validate(ai_message).model_dump(mode="json")
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    done.update(ttft_ms=elapsed_ms, total_ms=elapsed_ms, **done_extra)
+    yield sse_event("done", done)
+
+async def relay_ai_stream(chat_id: int, user_id: int, context: ChatContext, ticket: float, flight: Tuple[Tuple[int, int], asyncio.Future], cache_key: Optional[str] = None) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    ttft_ms = None
+    parts: List[str] = []
+    saved = False
+    try:
+        async for chunk in ollama_service.stream_response(messages=context.messages, system_prompt=context.system_prompt):
+            token = chunk.get("message", {}).get("content", "")
+            if not token:
+                continue
+            if ttft_ms is None:
+                ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                logger.debug("Time to first token for chat %s: %s ms", chat_id, ttft_ms)
+            parts.append(token)
+            await event_hub.publish(user_id, "ai.token", chat_id=chat_id, content=token)
+            yield sse_event("token", {"content": token})
+        
+        if not parts:
+            yield sse_event("error", {"detail": "Failed to generate AI response"})
+            return
+        
+        saved = True
+        content = "".join(parts)
+        ai_message = await asyncio.shield(save_for_flight(chat_id, user_id, content, flight))
+        if cache_key:
+            await response_cache.set(cache_key, content)
+        done = MessageResponse.model_validate(ai_message).model_dump(mode="json")
+        done.update(ttft_ms=ttft_ms, total_ms=round((time.perf_counter() - started) * 1000, 1))
+        if context.needs_summary:
+            schedule_summary_update(chat_id, user_id)
+        yield sse_event("done", done)
+    except Exception as e:
+        logger.warning("Error streaming AI response for chat %s: %s", chat_id, e)
+        yield sse_event("error", {"detail": "Failed to generate AI response"})
+    finally:
+        generation_limiter.release(ticket)
+        # Client disconnected or generation failed mid-stream: keep what we have.
+        # Nothing is awaited here: a cancelled stream (anyio cancels on every
+        # await) must not skip settling the flight its duplicates are waiting on.
+        if parts and not saved:
+            save_for_flight(chat_id, user_id, "".join(parts), flight)
+        elif not saved:
+            settle_flight(*flight)
+
+@router.post('/ai/generate/{chat_id}/stream')
+async def stream_ai_response(chat_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Stream the AI response for the latest message as Server-Sent Events (only if user owns the chat)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    context = await build_ai_context(db, chat, identity)
+    
+    # Don't hold a pooled DB connection for the lifetime of the stream
+    await db.close()
+    
+    return await open_ai_stream(chat_id, identity.id, context)
+
+async def with_prelude(prelude: str, events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Emit one event ahead of a stream, closing the inner stream with the outer one"""
+    try:
+        yield prelude
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+
+async def open_ai_stream(chat_id: int, user_id: int, context: ChatContext, prelude: Optional[str] = None) -> StreamingResponse:
+    """Internal helper to start (or join) the SSE stream answering a chat state"""
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    def respond(events: AsyncIterator[str]) -> StreamingResponse:
+        if prelude is not None:
+            events = with_prelude(prelude, events)
+        return StreamingResponse(events, media_type="text/event-stream", headers=sse_headers)
+    
+    # Same chat state already being answered: replay that result when it's ready
+    key = (chat_id, context.last_message_id)
+    inflight = _inflight_generations.get(key)
+    if inflight is not None:
+        return respond(replay_message_stream(asyncio.shield(inflight), shared=True))
+    
+    # Fail fast if Ollama is known to be down (cached health, no HTTP call)
+    if not ollama_service.is_available():
+        raise HTTPException(status_code=503, detail="AI service unavailable. Make sure Ollama is running.")
+    
+    # Register before the cache lookup and queueing so duplicates arriving meanwhile join this flight
+    future = asyncio.get_running_loop().create_future()
+    _inflight_generations[key] = future
+    
+    # Identical request answered before? (opt-in, see response_cache.py)
+    cache_key = ollama_service.cache_key(context.messages, context.system_prompt) if response_cache else None
+    try:
+        cached = await response_cache.get(cache_key) if cache_key else None
+    except BaseException:
+        settle_flight(key, future)
+        raise
+    if cached is not None:
+        # One save for everyone on this flight, finished even if this client disconnects
+        save = save_for_flight(chat_id, user_id, cached, (key, future))
+        return respond(replay_message_stream(asyncio.shield(save), cached=True))
+    
+    # Wait for a slot before the response starts, so rejections are real 429/503s
+    try:
+        ticket = await admit_generation(user_id)
+    except BaseException as e:
+        settle_flight(key, future, error=e if isinstance(e, HTTPException) else None)
+        raise
+    return respond(relay_ai_stream(chat_id, user_id, context, ticket, (key, future), cache_key))
+
+# ===============================================================================
+# CHAT TURN ENDPOINTS
+# ===============================================================================
+# One request per turn: store the user's message and answer it, instead of
+# POST /messages followed by POST /ai/generate/{chat_id}. Auth, user lookup and
+# ownership check happen once. Send an Idempotency-Key to make retries safe;
+# a retried turn that was already answered returns the stored answer.
+#   /ai/turn/{chat_id}         -> {"user_message": ..., "ai_message": ...}
+#   /ai/turn/{chat_id}/stream  -> SSE: message (the stored user message), then token/done/error
+
+async def find_reply(db: AsyncSession, user_message: Message) -> Optional[Message]:
+    """Internal helper to find the AI message that answered a user message"""
+    result = await db.execute(
+        select(Message)
+        .where(Message.chat_id == user_message.chat_id, Message.id > user_message.id)
+        .order_by(Message.id)
+        .limit(1)
+    )
+    reply = result.scalar_one_or_none()
+    return reply if reply is not None and not reply.is_from_user else None
+
+@router.post('/ai/turn/{chat_id}', response_model=TurnResponse)
+async def chat_turn(
+    chat_id: int,
+    turn: TurnCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Store a user message and generate the AI response in one request (only if user owns the chat)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    user_message, created = await store_message(db, identity.id, chat_id, turn.content, True, idempotency_key)
+    reply = None if created else await find_reply(db, user_message)
+    if reply is not None:
+        return TurnResponse(user_message=MessageResponse.model_validate(user_message), ai_message=MessageResponse.model_validate(reply))
+    
+    context = await build_ai_context(db, chat, identity)
+    
+    # Don't hold a pooled DB connection while queued or generating
+    await db.close()
+    
+    ai_message = await run_generation(chat_id, identity.id, context)
+    return TurnResponse(user_message=MessageResponse.model_validate(user_message), ai_message=MessageResponse.model_validate(ai_message))
+
+@router.post('/ai/turn/{chat_id}/stream')
+async def stream_chat_turn(
+    chat_id: int,
+    turn: TurnCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Store a user message and stream the AI response as Server-Sent Events (only if user owns the chat)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    user_message, created = await store_message(db, identity.id, chat_id, turn.content, True, idempotency_key)
+    prelude = sse_event("message", MessageResponse.model_validate(user_message).model_dump(mode="json"))
+    
+    reply = None if created else await find_reply(db, user_message)
+    if reply is not None:
+        await db.close()
+        return StreamingResponse(
+            with_prelude(prelude, replay_message_stream(asyncio.sleep(0, result=reply))),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
-        
-        db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
-        
-        return ai_message
-        
+    
+    context = await build_ai_context(db, chat, identity)
+    
+    # Don't hold a pooled DB connection for the lifetime of the stream
+    await db.close()
+    
+    return await open_ai_stream(chat_id, identity.id, context, prelude)
+
+# ===============================================================================
+# BACKGROUND GENERATION JOBS
+# ===============================================================================
+# Generation decoupled from the request (see job_service.py): POST returns a job
+# at once, workers answer it and save the AI message even if the client, the
+# proxy or this server goes away meanwhile. Poll GET /ai/jobs/{id}, or follow it
+# with GET /ai/jobs/{id}/stream (SSE):
+#   status -> JobResponse                   on every state change; a new running
+#                                           attempt restarts the token stream
+#   token  -> {"content": "..."}            streamed chunks (needs the worker to
+#                                           share the event broker, see README)
+#   done   -> MessageResponse               the saved AI message
+#   error  -> {"detail": "..."}             job failed or was cancelled
+
+JOB_STREAM_RECHECK = 5.0  # Seconds between job reloads while streaming (catches missed events)
+
+async def execute_generation_job(job: GenerationJob):
+    """Job worker body: answer the chat and save the answer together with the job's completion"""
+    async with SessionLocal() as db:
+        chat = await db.get(Chat, job.chat_id)
+        user = await db.get(User, job.user_id)
+        if chat is None or user is None:
+            raise JobFailed("Chat not found")
+        try:
+            # The chat as it was when the job was submitted, not whatever was added since
+            context = await build_ai_context(db, chat, UserIdentity(id=user.id, username=user.username, name=user.name), job.trigger_message_id)
+        except HTTPException as e:
+            raise JobFailed(e.detail)
+    
+    if not ollama_service.is_available():
+        raise RuntimeError("AI service unavailable")
+    
+    # Identical request answered before? (opt-in, see response_cache.py)
+    cache_key = ollama_service.cache_key(context.messages, context.system_prompt) if response_cache else None
+    content = await response_cache.get(cache_key) if cache_key else None
+    
+    if content is None:
+        try:
+            ticket = await generation_limiter.acquire(job.user_id)
+        except GenerationRejected as e:
+            raise JobRetry(e.retry_after)
+        parts: List[str] = []
+        try:
+            async for chunk in ollama_service.stream_response(messages=context.messages, system_prompt=context.system_prompt):
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    parts.append(token)
+                    await event_hub.publish(job.user_id, "ai.token", chat_id=job.chat_id, job_id=job.id, content=token)
+        finally:
+            generation_limiter.release(ticket)
+        if not parts:
+            raise RuntimeError("Empty AI response")
+        content = "".join(parts)
+        if cache_key:
+            await response_cache.set(cache_key, content)
+    
+    # Only saved if the job is still ours: a cancelled or re-run job never answers twice
+    async with SessionLocal() as session:
+        ai_message = Message(chat_id=job.chat_id, content=content, is_from_user=False)
+        session.add(ai_message)
+        await session.flush()
+        await session.execute(chat_activity_update(ai_message))
+        if not await job_runner.complete(session, job, ai_message.id):
+            await session.rollback()
+            return
+        await session.commit()
+        await session.refresh(ai_message)
+    await publish_message(job.user_id, ai_message)
+    
+    if context.needs_summary:
+        schedule_summary_update(job.chat_id, job.user_id)
+
+async def get_owned_job(db: AsyncSession, job_id: int, user_id: int) -> GenerationJob:
+    """Internal helper to load a job and verify ownership (404 otherwise)"""
+    result = await db.execute(select(GenerationJob).where(GenerationJob.id == job_id, GenerationJob.user_id == user_id))
+    job = result.scalar_one_or_none()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post('/ai/jobs/{chat_id}', response_model=JobResponse, status_code=202)
+async def submit_generation_job(chat_id: int, response: Response, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Queue an AI response for the latest message and return the job at once (only if user owns the chat)"""
+    # Check if user owns the chat
+    await get_owned_chat(db, chat_id, identity.id)
+    
+    result = await db.execute(select(func.max(Message.id)).where(Message.chat_id == chat_id))
+    last_message_id = result.scalar()
+    if last_message_id is None:
+        raise HTTPException(status_code=400, detail="No messages to respond to")
+    
+    # Same chat state submitted before, or already answered by a job: that job (restarted if it failed or was cancelled)
+    job, created = await job_runner.enqueue(db, chat_id, identity.id, last_message_id)
+    if not created:
+        response.status_code = 200
+    response.headers["Location"] = f"/ai/jobs/{job.id}"
+    return job
+
+@router.get('/ai/jobs/{job_id}', response_model=JobResponse)
+async def get_generation_job(job_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Get the state of a generation job (only if user owns it)"""
+    return await get_owned_job(db, job_id, identity.id)
+
+@router.delete('/ai/jobs/{job_id}', response_model=JobResponse)
+async def cancel_generation_job(job_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Cancel a queued or running generation job (only if user owns it)"""
+    job = await get_owned_job(db, job_id, identity.id)
+    if job.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    job = await job_runner.cancel(db, job)
+    if job.status != CANCELLED:
+        # Finished while we were cancelling it
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job
+
+async def job_event_stream(job_id: int, user_id: int) -> AsyncIterator[str]:
+    """Follow one job until it finishes: reload it on every job event, relay its tokens in between"""
+    queue = event_hub.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    last_state = None
+    try:
+        while True:
+            async with SessionLocal() as db:
+                job = await db.get(GenerationJob, job_id)
+                if job is None:
+                    yield sse_event("error", {"detail": "Job not found"})
+                    return
+                if (job.status, job.attempts) != last_state:
+                    last_state = (job.status, job.attempts)
+                    yield sse_event("status", JobResponse.model_validate(job).model_dump(mode="json"))
+                if job.status == SUCCEEDED:
+                    ai_message = await db.get(Message, job.result_message_id)
+                    if ai_message is None:
+                        yield sse_event("error", {"detail": "Message not found"})
+                    else:
+                        yield sse_event("done", MessageResponse.model_validate(ai_message).model_dump(mode="json"))
+                    return
+                if job.status in FINISHED_STATUSES:
+                    yield sse_event("error", {"detail": job.error or f"Job {job.status}"})
+                    return
+            
+            deadline = loop.time() + JOB_STREAM_RECHECK
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if event["type"] == "ai.token" and event.get("job_id") == job_id:
+                    yield sse_event("token", {"content": event["content"]})
+                elif event["type"] == "job.updated" and event["job"]["id"] == job_id:
+                    break
+                elif event["type"] == "resync":
+                    # Fell behind and was dropped from delivery: subscribe again, reload the job
+                    queue = event_hub.subscribe(user_id)
+                    break
+    finally:
+        event_hub.unsubscribe(user_id, queue)
+
+@router.get('/ai/jobs/{job_id}/stream')
+async def stream_generation_job(job_id: int, identity: UserIdentity = Depends(get_current_identity), db: AsyncSession = Depends(get_db)):
+    """Follow a generation job as Server-Sent Events (only if user owns it)"""
+    await get_owned_job(db, job_id, identity.id)
+    
+    # Don't hold a pooled DB connection for the lifetime of the stream
+    await db.close()
+    
+    return StreamingResponse(
+        job_event_stream(job_id, identity.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ===============================================================================
+# BULK IMPORT / EXPORT (NDJSON)
+# ===============================================================================
+# For migrations and backups of large accounts, one JSON object per line.
+#   POST /chats/{chat_id}/messages/import  <- {"content", "is_from_user", "created_at"?} per line,
+#                                             inserted in batches, all-or-nothing in one transaction
+#   GET  /users/me/export                  -> {"type": "chat", ...} followed by its {"type": "message", ...}
+#                                             lines, streamed from the database in batches
+# Exported message lines can be fed back into the import unchanged.
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+BULK_EXPORT_BATCH_SIZE = int(os.getenv("BULK_EXPORT_BATCH_SIZE", "1000"))
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a streamed request body into (line number, line), skipping blank lines"""
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+def parse_import_line(chat_id: int, line_number: int, line: bytes) -> dict:
+    """Internal helper to validate one import line into Message column values (400 if invalid)"""
+    try:
+        message = MessageImport.model_validate_json(line)
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in e.errors())
+        raise HTTPException(status_code=400, detail=f"Line {line_number}: {problems}")
+    created_at = message.created_at or datetime.utcnow()
+    if created_at.tzinfo is not None:
+        # Stored as naive UTC like every other timestamp
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return {"chat_id": chat_id, "content": message.content, "is_from_user": message.is_from_user, "created_at": created_at}
+
+@router.post('/chats/{chat_id}/messages/import', response_model=MessageImportResult)
+async def import_messages(
+    chat_id: int,
+    request: Request,
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Bulk-insert NDJSON messages into a chat in one transaction (only if user owns the chat)"""
+    # Check if user owns the chat
+    chat = await get_owned_chat(db, chat_id, identity.id)
+    
+    imported = 0
+    batch: List[dict] = []
+    try:
+        async for line_number, line in ndjson_lines(request.stream()):
+            batch.append(parse_import_line(chat_id, line_number, line))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                await db.execute(insert(Message), batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            await db.execute(insert(Message), batch)
+            imported += len(batch)
+        await db.execute(chat_aggregates_refresh(chat_id))
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    
+    logger.info("Imported %d messages into chat %d", imported, chat_id)
+    await db.refresh(chat)
+    await event_hub.publish(identity.id, "chat.updated", chat=ChatResponse.model_validate(chat).model_dump(mode="json"))
+    return MessageImportResult(chat_id=chat_id, imported=imported)
+
+def export_line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=datetime.isoformat) + "\n"
+
+async def export_user_data(user_id: int, chat_id: Optional[int]) -> AsyncIterator[str]:
+    """Stream a user's chats and messages as NDJSON, one batch of rows at a time"""
+    query = (
+        select(
+            Chat.id, Chat.title, Chat.created_at, Chat.updated_at,
+            Message.id, Message.content, Message.is_from_user, Message.created_at,
+        )
+        .outerjoin(Message, Message.chat_id == Chat.id)
+        .where(Chat.user_id == user_id)
+        .order_by(Chat.id, Message.created_at, Message.id)
+        .execution_options(yield_per=BULK_EXPORT_BATCH_SIZE)
+    )
+    if chat_id is not None:
+        query = query.where(Chat.id == chat_id)
+    
+    # Own session: the stream outlives the request's dependencies
+    async with SessionLocal() as session:
+        result = await session.stream(query)
+        current_chat = None
+        async for rows in result.partitions():
+            lines = []
+            for chat_id_, title, chat_created, chat_updated, message_id, content, is_from_user, created_at in rows:
+                if chat_id_ != current_chat:
+                    current_chat = chat_id_
+                    lines.append(export_line({
+                        "type": "chat", "id": chat_id_, "title": title,
+                        "created_at": chat_created, "updated_at": chat_updated,
+                    }))
+                if message_id is not None:
+                    lines.append(export_line({
+                        "type": "message", "id": message_id, "chat_id": chat_id_, "content": content,
+                        "is_from_user": is_from_user, "created_at": created_at,
+                    }))
+            yield "".join(lines)
+
+@router.get('/users/me/export')
+async def export_messages(
+    chat_id: Optional[int] = None,
+    identity: UserIdentity = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream all of the user's chats and messages (or a single chat) as NDJSON"""
+    if chat_id is not None:
+        await get_owned_chat(db, chat_id, identity.id)
+    await db.close()
+    
+    return StreamingResponse(
+        export_user_data(identity.id, chat_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="crudai-export.ndjson"'}
+    )
+
+# ===============================================================================
+# LIVE UPDATES (WEBSOCKET)
+# ===============================================================================
+# Pushes the user's events (see events_service.py) to every open tab/device,
+# so clients don't have to poll or refetch lists. Browsers can't set headers on
+# a WebSocket, and tokens in the URL end up in access logs, so the first client
+# message authenticates:
+#   client -> {"type": "auth", "token": "<JWT>"}
+#   server -> {"type": "ready"}, then events; {"type": "pong"} for {"type": "ping"}
+# A "resync" event means events were dropped: reload over REST.
+
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+
+async def authenticate_websocket(websocket: WebSocket) -> Optional[UserIdentity]:
+    """Internal helper to read the auth message and resolve the user (None if rejected)"""
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+        if not isinstance(hello, dict) or hello.get("type") != "auth" or not hello.get("token"):
+            return None
+        claims = await auth_service.verify_token(str(hello["token"]))
+        async with SessionLocal() as db:
+            return await get_current_identity(claims, db)
+    except (asyncio.TimeoutError, ValueError, KeyError, HTTPException, WebSocketDisconnect):
+        # KeyError: binary frame instead of text; WebSocketDisconnect: client left during auth
+        return None
+
+@router.websocket('/ws')
+async def live_updates(websocket: WebSocket):
+    """Authenticated push channel for message, AI token and chat events"""
+    await websocket.accept()
+    identity = await authenticate_websocket(websocket)
+    if identity is None:
+        if websocket.client_state != WebSocketState.DISCONNECTED:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    queue = event_hub.subscribe(identity.id)
+    
+    async def receive_pings():
+        # Also notices the client going away
+        while True:
+            message = await websocket.receive_json()
+            if isinstance(message, dict) and message.get("type") == "ping":
+                await websocket.send_json({"type": "pong"})
+    
+    async def send_events():
+        await websocket.send_json({"type": "ready"})
+        while True:
+            event = await queue.get()
+            await websocket.send_json(event)
+            if event["type"] == "resync":
+                await websocket.close()
+                return
+    
+    tasks = [asyncio.ensure_future(receive_pings()), asyncio.ensure_future(send_events())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        db.close()
+        event_hub.unsubscribe(identity.id, queue)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -6,6 +6,7 @@
 
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 # ===============================================================================
 # USER SCHEMAS
@@ -54,6 +55,10 @@ class ChatResponse(BaseModel):
     user_id: int
     created_at: datetime
     updated_at: datetime
+    last_activity_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+    last_ai_message_id: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -79,4 +84,73 @@ class MessageResponse(BaseModel):
     created_at: datetime
     
     class Config:
-        from_attributes = True  # Allow ORM model conversion
\ No newline at end of file
+        from_attributes = True  # Allow ORM model conversion
+
+# ===============================================================================
+# CHAT TURN SCHEMAS
+# ===============================================================================
+# User message in, stored user message plus AI answer out (one round-trip)
+
+class TurnCreate(BaseModel):
+    content: str
+    
+    class Config:
+        extra = "forbid"  # Reject unknown fields
+
+class TurnResponse(BaseModel):
+    user_message: MessageResponse
+    ai_message: MessageResponse
+
+# ===============================================================================
+# BULK IMPORT SCHEMAS
+# ===============================================================================
+# One NDJSON line of POST /chats/{chat_id}/messages/import
+
+class MessageImport(BaseModel):
+    content: str
+    is_from_user: bool
+    created_at: Optional[datetime] = None  # Defaults to import time
+    
+    class Config:
+        extra = "ignore"  # Lines from GET /export carry id, chat_id and type
+
+class MessageImportResult(BaseModel):
+    chat_id: int
+    imported: int
+
+# ===============================================================================
+# SEARCH SCHEMAS
+# ===============================================================================
+# One ranked hit of GET /search (a message, or a chat whose title matched)
+
+class SearchResult(BaseModel):
+    kind: str  # "message" | "chat"
+    chat_id: int
+    chat_title: str
+    message_id: Optional[int] = None
+    is_from_user: Optional[bool] = None
+    created_at: datetime
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    rank: float
+    
+    class Config:
+        from_attributes = True
+
+# ===============================================================================
+# GENERATION JOB SCHEMAS
+# ===============================================================================
+# State of a background generation (POST /ai/jobs/{chat_id})
+
+class JobResponse(BaseModel):
+    id: int
+    chat_id: int
+    status: str  # queued | running | succeeded | failed | cancelled
+    attempts: int
+    result_message_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
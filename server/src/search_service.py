@@ -0,0 +1,160 @@
+# ===============================================================================
+# CRUD AI CHAT APP - SEARCH SERVICE
+# ===============================================================================
+# Ranked full-text search over a user's messages and chat titles
+# Backed by SQLite FTS5 tables or PostgreSQL tsvector/GIN (see migrations.py)
+
+import html
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# ===============================================================================
+# CONFIGURATION
+# ===============================================================================
+# Words taken from the query (the rest is ignored)
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "8"))
+# Approximate snippet length in characters
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "160"))
+
+# ===============================================================================
+# QUERIES
+# ===============================================================================
+# Every word must match; each word also matches as a prefix ("deploy" finds
+# "deployment"), so search-as-you-type works. Messages and chat titles are
+# ranked together (bm25 / ts_rank_cd). The index itself is scoped to the
+# caller (FTS5 owner column / composite GIN), so other users' matches are
+# never fetched or ranked.
+
+_COLUMNS = dict(
+    kind=String, chat_id=Integer, chat_title=String, message_id=Integer,
+    is_from_user=Boolean, created_at=DateTime, body=String, rank=Float,
+)
+
+_SQLITE_SEARCH = text("""
+    SELECT * FROM (
+        SELECT 'message' AS kind, m.chat_id AS chat_id, c.title AS chat_title, m.id AS message_id,
+               m.is_from_user AS is_from_user, m.created_at AS created_at, m.content AS body,
+               messages_fts.rank AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        JOIN chats c ON c.id = m.chat_id
+        WHERE messages_fts MATCH :query AND c.user_id = :user_id
+        UNION ALL
+        SELECT 'chat', c.id, c.title, NULL, NULL, c.updated_at, c.title, chats_fts.rank
+        FROM chats_fts
+        JOIN chats c ON c.id = chats_fts.rowid
+        WHERE chats_fts MATCH :query AND c.user_id = :user_id
+    )
+    ORDER BY rank, chat_id, message_id
+    LIMIT :limit OFFSET :offset
+""").columns(**_COLUMNS)
+
+_POSTGRES_SEARCH = text("""
+    SELECT * FROM (
+        SELECT 'message' AS kind, m.chat_id AS chat_id, c.title AS chat_title, m.id AS message_id,
+               m.is_from_user AS is_from_user, m.created_at AS created_at, m.content AS body,
+               ts_rank_cd(m.search_vector, q.query) AS rank
+        FROM messages m
+        JOIN chats c ON c.id = m.chat_id
+        CROSS JOIN to_tsquery('simple', :query) AS q(query)
+        WHERE m.chat_id = ANY(ARRAY(SELECT id FROM chats WHERE user_id = :user_id))
+          AND m.search_vector @@ q.query AND c.user_id = :user_id
+        UNION ALL
+        SELECT 'chat', c.id, c.title, NULL, NULL, c.updated_at, c.title, ts_rank_cd(c.search_vector, q.query)
+        FROM chats c
+        CROSS JOIN to_tsquery('simple', :query) AS q(query)
+        WHERE c.search_vector @@ q.query AND c.user_id = :user_id
+    ) hits
+    ORDER BY rank DESC, chat_id, message_id
+    LIMIT :limit OFFSET :offset
+""").columns(**_COLUMNS)
+
+def search_terms(query: str) -> List[str]:
+    """Words of a user query; punctuation and operators are dropped, so nothing can inject FTS syntax"""
+    return re.findall(r"\w+", query)[:SEARCH_MAX_TERMS]
+
+def match_expression(terms: List[str], dialect: str, user_id: int) -> str:
+    """All terms, each as a prefix, in the dialect's full-text query syntax (SQLite: within the owner's rows)"""
+    if dialect == "sqlite":
+        words = " ".join(f'"{term}"*' for term in terms)
+        return f'owner : "u{user_id}" AND body : ({words})'
+    return " & ".join(f"{term}:*" for term in terms)
+
+# ===============================================================================
+# SNIPPETS
+# ===============================================================================
+# Built in Python for the page of hits only (instead of snippet()/ts_headline()
+# on every match), so both databases return the same HTML-safe format:
+# escaped text with matches wrapped in <mark>...</mark>.
+
+def fold(value: str) -> str:
+    """Strip diacritics character by character (same length), like the FTS tokenizer"""
+    return "".join(unicodedata.normalize("NFD", char)[0] for char in value)
+
+def highlight(body: str, terms: List[str]) -> str:
+    """Window of body around the first match, HTML-escaped, matches in <mark>"""
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(fold(term)) for term in terms) + r")\w*", re.IGNORECASE)
+    folded = fold(body)
+    first = pattern.search(folded)
+    start = 0
+    if first and len(body) > SEARCH_SNIPPET_CHARS:
+        start = max(0, min(first.start() - SEARCH_SNIPPET_CHARS // 4, len(body) - SEARCH_SNIPPET_CHARS))
+    end = min(len(body), start + SEARCH_SNIPPET_CHARS)
+    # Don't cut words in half
+    if start > 0:
+        space = body.find(" ", start, first.start())
+        start = space + 1 if space != -1 else start
+    if end < len(body):
+        space = body.rfind(" ", start + SEARCH_SNIPPET_CHARS // 2, end)
+        end = space if space != -1 else end
+    window = body[start:end]
+
+    parts = []
+    position = 0
+    for match in pattern.finditer(folded, start, end):
+        parts.append(html.escape(body[start + position:match.start()]))
+        parts.append(f"<mark>{html.escape(body[match.start():match.end()])}</mark>")
+        position = match.end() - start
+    parts.append(html.escape(window[position:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(body) else "")
+
+# ===============================================================================
+# SEARCH
+# ===============================================================================
+
+@dataclass
+class SearchHit:
+    kind: str  # "message" or "chat" (title match)
+    chat_id: int
+    chat_title: str
+    message_id: Optional[int]
+    is_from_user: Optional[bool]
+    created_at: datetime
+    snippet: str
+    rank: float
+
+async def search_user_history(db: AsyncSession, user_id: int, query: str, limit: int, offset: int) -> List[SearchHit]:
+    """Best-ranked messages and chats of one user matching query"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    dialect = db.bind.dialect.name
+    statement = _SQLITE_SEARCH if dialect == "sqlite" else _POSTGRES_SEARCH
+    result = await db.execute(statement, {
+        "query": match_expression(terms, dialect, user_id), "user_id": user_id, "limit": limit, "offset": offset,
+    })
+    return [
+        SearchHit(
+            kind=row.kind, chat_id=row.chat_id, chat_title=row.chat_title, message_id=row.message_id,
+            is_from_user=row.is_from_user, created_at=row.created_at,
+            snippet=highlight(row.body, terms), rank=row.rank,
+        )
+        for row in result
+    ]
@@ -0,0 +1,141 @@
+# ===============================================================================
+# CRUD AI CHAT APP - USER IDENTITY SERVICE
+# ===============================================================================
+# Resolves the Auth0 `sub` claim to the local User row once per request
+# Caches the mapping in memory (or a shared Redis) and creates users atomically
+
+import os
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from models import User
+from auth_service import get_current_user
+
+# ===============================================================================
+# IDENTITY RECORD
+# ===============================================================================
+# The subset of the User row that routes need on every request
+
+@dataclass
+class UserIdentity:
+    id: int
+    username: str
+    name: Optional[str] = None
+
+# ===============================================================================
+# CACHE BACKENDS
+# ===============================================================================
+# In-memory LRU per worker by default; Redis when USER_CACHE_REDIS_URL is set
+
+class InMemoryIdentityBackend:
+    """Bounded LRU of sub -> UserIdentity with a TTL per entry"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[UserIdentity, float]]" = OrderedDict()
+
+    async def get(self, sub: str) -> Optional[UserIdentity]:
+        entry = self._entries.get(sub)
+        if entry is None:
+            return None
+        identity, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[sub]
+            return None
+        self._entries.move_to_end(sub)
+        return identity
+
+    async def set(self, sub: str, identity: UserIdentity):
+        self._entries[sub] = (identity, time.monotonic() + self.ttl)
+        self._entries.move_to_end(sub)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, sub: str):
+        self._entries.pop(sub, None)
+
+class RedisIdentityBackend:
+    """Shared cache for multi-worker deployments (requires the `redis` package)"""
+
+    def __init__(self, url: str, ttl: float = 300.0, prefix: str = "crudai:user:"):
+        import redis.asyncio as redis  # optional dependency, only needed when configured
+        self._redis = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, sub: str) -> Optional[UserIdentity]:
+        raw = await self._redis.get(self.prefix + sub)
+        return UserIdentity(**json.loads(raw)) if raw else None
+
+    async def set(self, sub: str, identity: UserIdentity):
+        await self._redis.set(self.prefix + sub, json.dumps(asdict(identity)), ex=int(self.ttl))
+
+    async def delete(self, sub: str):
+        await self._redis.delete(self.prefix + sub)
+
+def _create_backend():
+    ttl = float(os.getenv("USER_CACHE_TTL", "300"))
+    redis_url = os.getenv("USER_CACHE_REDIS_URL")
+    if redis_url:
+        return RedisIdentityBackend(redis_url, ttl=ttl)
+    return InMemoryIdentityBackend(max_size=int(os.getenv("USER_CACHE_SIZE", "10000")), ttl=ttl)
+
+user_cache = _create_backend()
+
+# ===============================================================================
+# ATOMIC FIRST-LOGIN CREATION
+# ===============================================================================
+# INSERT ... ON CONFLICT DO NOTHING so concurrent first requests can't race
+
+def _default_username(claims: dict) -> str:
+    return claims.get("nickname") or claims.get("email", "user").split("@")[0]
+
+async def upsert_user(db: AsyncSession, claims: dict) -> User:
+    """Create the user for these Auth0 claims if missing and return the row"""
+    auth0_user_id = claims.get("sub")
+    user = (await db.execute(select(User).where(User.auth0_user_id == auth0_user_id))).scalar_one_or_none()
+    if user:
+        return user
+
+    dialect = db.bind.dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    values = dict(
+        auth0_user_id=auth0_user_id,
+        username=_default_username(claims),
+        email=claims.get("email", ""),
+        name=claims.get("name") or _default_username(claims),
+        picture=claims.get("picture") or "",
+    )
+    await db.execute(insert(User).values(**values).on_conflict_do_nothing(index_elements=[User.auth0_user_id]))
+    await db.commit()
+    return (await db.execute(select(User).where(User.auth0_user_id == auth0_user_id))).scalar_one()
+
+# ===============================================================================
+# FASTAPI DEPENDENCY
+# ===============================================================================
+# Use instead of looking up User by auth0_user_id in every route
+
+async def get_current_identity(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> UserIdentity:
+    """Resolve the authenticated user's local identity (cached, auto-created)"""
+    sub = current_user.get("sub")
+    identity = await user_cache.get(sub)
+    if identity is None:
+        user = await upsert_user(db, current_user)
+        identity = UserIdentity(id=user.id, username=user.username, name=user.name)
+        await user_cache.set(sub, identity)
+    return identity
+
+async def invalidate_identity(sub: str):
+    """Drop the cached identity, e.g. after the profile changed"""
+    await user_cache.delete(sub)
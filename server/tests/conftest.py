@@ -0,0 +1,36 @@
+# ===============================================================================
+# CRUD AI CHAT APP - TEST CONFIGURATION
+# ===============================================================================
+# Server modules import each other by plain name (run from server/src), so the
+# tests put that directory on the path the same way.
+#
+# Tests that touch the database share one throwaway SQLite file and run with
+# Auth0 disabled (development user), whatever the local .env says.
+#
+# Run from server/: python -m pytest -q tests
+
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='crudai-tests-'), 'test.db')}"
+for name in ("AUTH0_DOMAIN", "AUTH0_API_AUDIENCE", "AUTH0_ISSUER"):
+    os.environ[name] = ""
+os.environ["AI_RESPONSE_CACHE"] = "off"
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Answer every streamed generation with "Antwort"; returns the turns each one was given"""
+    import routes
+    prompts = []
+
+    async def stream_response(messages, system_prompt=None):
+        prompts.append([message["content"] for message in messages])
+        yield {"message": {"content": "Antwort"}}
+
+    monkeypatch.setattr(routes.ollama_service, "stream_response", stream_response)
+    monkeypatch.setattr(routes.ollama_service, "is_available", lambda: True)
+    return prompts
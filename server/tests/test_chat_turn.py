@@ -0,0 +1,47 @@
+# ===============================================================================
+# CRUD AI CHAT APP - CHAT TURN TESTS
+# ===============================================================================
+# Retrying a streamed turn with the same Idempotency-Key
+
+import asyncio
+import json
+import httpx
+from fastapi import FastAPI
+from routes import router
+from database import init_db, close_db
+
+app = FastAPI()
+app.include_router(router)
+
+def sse_events(body: str) -> dict:
+    """Map event name -> parsed data of an SSE response body"""
+    events = {}
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events[lines["event"]] = json.loads(lines["data"])
+    return events
+
+def test_retried_stream_turn_stores_once_and_replays_answer(fake_model):
+    async def scenario():
+        await init_db()
+        try:
+            # Auth0 is off in tests: any bearer token is the development user
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test",
+                                         headers={"Authorization": "Bearer test"}) as client:
+                chat_id = (await client.post("/chats", json={"title": "Retry"})).json()["id"]
+                turn = dict(json={"content": "hi"}, headers={"Idempotency-Key": "turn-1"})
+
+                first = sse_events((await client.post(f"/ai/turn/{chat_id}/stream", **turn)).text)
+                # The client lost the response and sends the same turn again
+                retry = sse_events((await client.post(f"/ai/turn/{chat_id}/stream", **turn)).text)
+
+                assert retry["message"]["id"] == first["message"]["id"]
+                assert retry["done"]["id"] == first["done"]["id"]
+                assert retry["done"]["content"] == "Antwort"
+                messages = (await client.get(f"/messages/{chat_id}")).json()
+                assert [(m["content"], m["is_from_user"]) for m in messages] == [("hi", True), ("Antwort", False)]
+                assert len(fake_model) == 1
+        finally:
+            await close_db()
+
+    asyncio.run(scenario())
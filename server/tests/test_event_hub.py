@@ -0,0 +1,54 @@
+# ===============================================================================
+# CRUD AI CHAT APP - EVENT HUB TESTS
+# ===============================================================================
+# Publishing must not wait for the broker (a Redis round trip per token)
+
+import asyncio
+import time
+from events_service import EventHub
+
+class SlowBroker:
+    def __init__(self):
+        self.published = []
+
+    async def start(self, deliver):
+        pass
+
+    async def publish(self, user_id, event):
+        await asyncio.sleep(0.05)
+        self.published.append((user_id, event))
+
+    async def close(self):
+        pass
+
+def test_token_publish_does_not_wait_for_broker():
+    async def scenario():
+        broker = SlowBroker()
+        hub = EventHub(broker)
+        await hub.start()
+
+        started = time.perf_counter()
+        for token in ("Hal", "lo ", "Welt"):
+            await hub.publish(1, "ai.token", chat_id=5, content=token)
+        await hub.publish(1, "message.created", message={"id": 9})
+        assert time.perf_counter() - started < 0.05
+
+        await hub.close()
+        # Queued tokens were merged into one broker publish, order kept
+        assert broker.published == [
+            (1, {"type": "ai.token", "chat_id": 5, "content": "Hallo Welt"}),
+            (1, {"type": "message.created", "message": {"id": 9}}),
+        ]
+
+    asyncio.run(scenario())
+
+def test_tokens_dropped_when_outbox_full():
+    async def scenario():
+        hub = EventHub(SlowBroker(), outbox_size=2)
+        await hub.start()
+        for token in "abcde":
+            await hub.publish(1, "ai.token", chat_id=5, content=token)
+        assert hub.dropped_tokens == 3
+        await hub.close()
+
+    asyncio.run(scenario())
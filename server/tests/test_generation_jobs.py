@@ -0,0 +1,83 @@
+# ===============================================================================
+# CRUD AI CHAT APP - BACKGROUND GENERATION JOB TESTS
+# ===============================================================================
+# Which chat state a job answers, and resubmitting once it has answered
+
+import asyncio
+import uuid
+from sqlalchemy import func, select
+import routes
+from database import SessionLocal, init_db, close_db
+from job_service import job_runner, SUCCEEDED
+from models import Chat, GenerationJob, Message, User
+
+async def create_chat(*contents: str):
+    """A user with one chat holding the given user messages; returns (user_id, chat_id, message ids)"""
+    async with SessionLocal() as db:
+        user = User(auth0_user_id=f"test|{uuid.uuid4().hex}", username="test", email="test@example.com")
+        db.add(user)
+        await db.flush()
+        chat = Chat(user_id=user.id, title="Test")
+        db.add(chat)
+        await db.flush()
+        messages = [Message(chat_id=chat.id, content=content, is_from_user=True) for content in contents]
+        db.add_all(messages)
+        await db.commit()
+        return user.id, chat.id, [message.id for message in messages]
+
+async def add_message(chat_id: int, content: str) -> int:
+    async with SessionLocal() as db:
+        message = Message(chat_id=chat_id, content=content, is_from_user=True)
+        db.add(message)
+        await db.commit()
+        return message.id
+
+async def run_next_job() -> GenerationJob:
+    job = await job_runner._claim()
+    await routes.execute_generation_job(job)
+    async with SessionLocal() as db:
+        return await db.get(GenerationJob, job.id)
+
+def test_job_answers_the_chat_state_it_was_submitted_for(fake_model):
+    prompts = fake_model
+
+    async def scenario():
+        await init_db()
+        try:
+            user_id, chat_id, (first_id,) = await create_chat("first")
+            async with SessionLocal() as db:
+                job, created = await job_runner.enqueue(db, chat_id, user_id, first_id)
+            assert created
+
+            # Sent while the job was still queued: not part of this job's answer
+            await add_message(chat_id, "later")
+
+            job = await run_next_job()
+            assert job.status == SUCCEEDED
+            assert prompts == [["first"]]
+        finally:
+            await close_db()
+
+    asyncio.run(scenario())
+
+def test_resubmit_after_job_answered_returns_that_job(fake_model):
+    prompts = fake_model
+
+    async def scenario():
+        await init_db()
+        try:
+            user_id, chat_id, (message_id,) = await create_chat("hi")
+            async with SessionLocal() as db:
+                job, _ = await job_runner.enqueue(db, chat_id, user_id, message_id)
+            job = await run_next_job()
+
+            # The newest message is now the job's own answer
+            async with SessionLocal() as db:
+                again, created = await job_runner.enqueue(db, chat_id, user_id, job.result_message_id)
+                jobs = (await db.execute(select(func.count()).select_from(GenerationJob).where(GenerationJob.chat_id == chat_id))).scalar()
+            assert (again.id, created, jobs) == (job.id, False, 1)
+            assert len(prompts) == 1
+        finally:
+            await close_db()
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+# ===============================================================================
+# CRUD AI CHAT APP - GENERATION LIMITER TESTS
+# ===============================================================================
+# Slot accounting when waiters give up at the same moment a slot frees up
+
+import asyncio
+from ai_service import GenerationLimiter, GenerationRejected
+
+def test_release_skips_waiter_cancelled_in_same_tick():
+    async def scenario():
+        limiter = GenerationLimiter(max_in_flight=1, queue_timeout=5)
+        ticket = await limiter.acquire("a")
+        cancelled = asyncio.ensure_future(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+
+        # Cancel the waiter and free the slot before it gets to run its cleanup
+        cancelled.cancel()
+        limiter.release(ticket)
+
+        # The cancellation wins and the slot it was just granted is handed back
+        outcome = (await asyncio.gather(cancelled, return_exceptions=True))[0]
+        assert isinstance(outcome, asyncio.CancelledError)
+        assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+        # The slot is usable again
+        limiter.release(await asyncio.wait_for(limiter.acquire("c"), 1))
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_release_skips_waiter_whose_future_is_already_done():
+    async def scenario():
+        limiter = GenerationLimiter(max_in_flight=1, queue_timeout=5)
+        ticket = await limiter.acquire("a")
+        gone = asyncio.ensure_future(limiter.acquire("b"))
+        waiting = asyncio.ensure_future(limiter.acquire("c"))
+        await asyncio.sleep(0)
+
+        # A timed-out or cancelled wait leaves its future queued for one more tick
+        limiter._waiters["b"][0].cancel()
+        limiter.release(ticket)
+
+        # The slot went to the next live waiter instead of being lost
+        assert limiter.in_flight == 1
+        limiter.release(await asyncio.wait_for(waiting, 1))
+        await asyncio.gather(gone, return_exceptions=True)
+        assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+def test_timed_out_waiter_leaves_queue():
+    async def scenario():
+        limiter = GenerationLimiter(max_in_flight=1, queue_timeout=0.01)
+        ticket = await limiter.acquire("a")
+        try:
+            await limiter.acquire("b")
+        except GenerationRejected as e:
+            assert e.status_code == 503
+        else:
+            raise AssertionError("acquire should time out")
+        assert (limiter.in_flight, limiter.queued, limiter.timed_out) == (1, 0, 1)
+        limiter.release(ticket)
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+# ===============================================================================
+# CRUD AI CHAT APP - RESPONSE CACHE KEY TESTS
+# ===============================================================================
+# Cached answers must come from a model the configured backends actually serve
+
+from ai_service import OllamaService
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def service(monkeypatch, backends: str) -> OllamaService:
+    monkeypatch.setenv("OLLAMA_MODEL", "llama3.2:3b")
+    monkeypatch.setenv("LLM_BACKENDS", backends)
+    return OllamaService()
+
+def test_cache_key_uses_backend_models_not_default(monkeypatch):
+    default = service(monkeypatch, "ollama http://a:11434")
+    vllm = service(monkeypatch, "openai http://vllm:8000/v1 qwen2.5:7b")
+    assert default.cache_key(MESSAGES) != vllm.cache_key(MESSAGES)
+
+def test_cache_key_covers_every_model_in_a_mixed_pool(monkeypatch):
+    single = service(monkeypatch, "ollama http://a:11434, ollama http://b:11434")
+    mixed = service(monkeypatch, "ollama http://a:11434, openai http://vllm:8000/v1 qwen2.5:7b")
+    reordered = service(monkeypatch, "openai http://vllm:8000/v1 qwen2.5:7b, ollama http://a:11434")
+    assert single.cache_key(MESSAGES) != mixed.cache_key(MESSAGES)
+    assert mixed.cache_key(MESSAGES) == reordered.cache_key(MESSAGES)
@@ -0,0 +1,51 @@
+# ===============================================================================
+# CRUD AI CHAT APP - SINGLE-FLIGHT GENERATION TESTS
+# ===============================================================================
+# Callers joined to a streamed generation when its client goes away
+
+import asyncio
+from types import SimpleNamespace
+import anyio
+import routes
+from context_service import ChatContext
+
+def test_disconnect_mid_stream_settles_joined_callers(monkeypatch):
+    saved = []
+
+    async def stream_response(messages, system_prompt=None):
+        for token in ("Hal", "lo ", "Welt"):
+            yield {"message": {"content": token}}
+        await asyncio.Event().wait()  # Model still generating when the client leaves
+
+    async def save_ai_message(chat_id, user_id, content):
+        await asyncio.sleep(0.05)  # Long enough to be cancelled again while awaited
+        saved.append(content)
+        return SimpleNamespace(content=content)
+
+    monkeypatch.setattr(routes.ollama_service, "stream_response", stream_response)
+    monkeypatch.setattr(routes, "save_ai_message", save_ai_message)
+
+    async def scenario():
+        key = (1, 10)
+        future = asyncio.get_running_loop().create_future()
+        routes._inflight_generations[key] = future
+        context = ChatContext(messages=[{"role": "user", "content": "hi"}], system_prompt="", last_message_id=10, needs_summary=False)
+        ticket = await routes.generation_limiter.acquire(1)
+        stream = routes.relay_ai_stream(1, 1, context, ticket, (key, future))
+        joined = asyncio.ensure_future(asyncio.shield(future))
+
+        # Starlette cancels the response on disconnect, and keeps cancelling every await
+        with anyio.CancelScope() as scope:
+            received = 0
+            async for _ in stream:
+                received += 1
+                if received == 3:
+                    scope.cancel()
+
+        message = await asyncio.wait_for(joined, 1)
+        assert message.content == "Hallo Welt"
+        assert saved == ["Hallo Welt"]
+        assert key not in routes._inflight_generations
+        assert routes.generation_limiter.in_flight == 0
+
+    asyncio.run(scenario())